@@ -0,0 +1,122 @@
+// Linked figures of crossfilter page, computed in browser from count table sent once by server
+// Each figure is filtered by selections in other figures, click on figure toggles its value in selection
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    crossfilter: {
+        // Click on figure: toggle clicked value, reset button: clear selection
+        select: function (pieClick, sunburstClick, barClick, resetClicks, selection) {
+            const triggered = dash_clientside.callback_context.triggered.map(item => item.prop_id);
+            const empty = {drugType: [], targetLocationCluster: [], targetLocationName: [], multipleLocations: []};
+            if (!triggered.length || triggered[0].startsWith('xf-reset')) {
+                return empty;
+            }
+            selection = Object.assign({}, empty, selection);
+
+            let dim = null, value = null;
+            if (triggered[0].startsWith('xf-pie')) {
+                dim = 'targetLocationCluster';
+                value = pieClick.points[0].label;
+            } else if (triggered[0].startsWith('xf-bar')) {
+                dim = 'drugType';
+                value = barClick.points[0].x;
+            } else if (triggered[0].startsWith('xf-sunburst')) {
+                // Sunburst ids: ML | ML/location
+                const parts = sunburstClick.points[0].id.split('/');
+                dim = parts.length > 1 ? 'targetLocationName' : 'multipleLocations';
+                value = parts[parts.length - 1];
+            }
+            if (dim === null) {
+                return dash_clientside.no_update;
+            }
+            const values = selection[dim].filter(item => item !== value);
+            selection[dim] = values.length < selection[dim].length ? values : selection[dim].concat([value]);
+            return selection;
+        },
+
+        // Pie, sunburst and bar of rows count over rows matching selection in other figures
+        figures: function (selection, payload) {
+            if (!payload) {
+                return [dash_clientside.no_update, dash_clientside.no_update, dash_clientside.no_update,
+                        'Loading counts...'];
+            }
+            selection = selection || {};
+            const rows = payload.count.length;
+
+            // Selected codes of every dimension, null if not filtered
+            const selected = {};
+            payload.dims.forEach(dim => {
+                const values = selection[dim] || [];
+                selected[dim] = values.length ? new Set(values.map(value => payload.categories[dim].indexOf(value))) : null;
+            });
+
+            // Counts by dims over rows matching selections in other dimensions: figure is not filtered by itself
+            const counts = (dims) => {
+                const result = new Map();
+                for (let row = 0; row < rows; row++) {
+                    const matches = payload.dims.every(dim => dims.includes(dim) || selected[dim] === null
+                        || selected[dim].has(payload.codes[dim][row]));
+                    if (!matches) {
+                        continue;
+                    }
+                    const key = dims.map(dim => payload.categories[dim][payload.codes[dim][row]]).join('/');
+                    result.set(key, (result.get(key) || 0) + payload.count[row]);
+                }
+                return result;
+            };
+
+            const layout = title => ({title: {text: title}, font: {size: 20}});
+            const opacity = (dim, values) => values.map(
+                value => selected[dim] === null || selection[dim].includes(value) ? 1 : 0.3);
+
+            const clusters = counts(['targetLocationCluster']);
+            const clusterNames = Array.from(clusters.keys());
+            const pie = {
+                data: [{
+                    type: 'pie', labels: clusterNames, values: Array.from(clusters.values()), sort: false,
+                    marker: {colors: clusterNames.map(name => payload.colors.targetLocationCluster[name])},
+                    pull: clusterNames.map(name => (selection.targetLocationCluster || []).includes(name) ? 0.1 : 0),
+                }],
+                layout: layout('Clusters'),
+            };
+
+            const locations = counts(['multipleLocations', 'targetLocationName']);
+            const ids = [], parents = [], values = [], totals = new Map();
+            locations.forEach((count, key) => {
+                const parent = key.split('/')[0];
+                totals.set(parent, (totals.get(parent) || 0) + count);
+                ids.push(key);
+                parents.push(parent);
+                values.push(count);
+            });
+            totals.forEach((count, key) => {
+                ids.push(key);
+                parents.push('');
+                values.push(count);
+            });
+            const sunburst = {
+                data: [{
+                    type: 'sunburst', ids: ids, parents: parents, values: values, branchvalues: 'total',
+                    labels: ids.map(id => id.split('/').pop()),
+                }],
+                layout: layout('MLP | Locations'),
+            };
+
+            const modalities = counts(['drugType']);
+            const modalityNames = Array.from(modalities.keys());
+            const bar = {
+                data: [{
+                    type: 'bar', x: modalityNames, y: Array.from(modalities.values()),
+                    marker: {
+                        color: modalityNames.map(name => payload.colors.drugType[name]),
+                        opacity: opacity('drugType', modalityNames),
+                    },
+                }],
+                layout: Object.assign(layout('Drug modalities'), {yaxis: {type: 'log'}}),
+            };
+
+            const filters = payload.dims.filter(dim => selected[dim] !== null)
+                .map(dim => `${dim}: ${selection[dim].join(', ')}`);
+            return [pie, sunburst, bar, filters.length ? filters.join(' | ') : 'No filters'];
+        },
+    },
+});
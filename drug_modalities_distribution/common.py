@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
+import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import pandas as pd
 import config as config
+import storage as storage
 import os
 
 
@@ -20,13 +24,122 @@ class Log:
         print(info)
         return info
 
-    def write_csv(self, dataset_df):
-        out_file = f'{os.path.join(config.results_dir, self.job)}.csv'
-        dataset_df.to_csv(out_file, index=False)
-        return out_file
+    def write_result(self, dataset_df):
+        """Write result in configured format of intermediate results"""
+        return storage.write_frame(dataset_df, self.job)
 
     @staticmethod
     def write_list_to_file(filename, datalist):
         with open(f'{filename}.txt', 'w') as outfile:
             for el in datalist:
                 outfile.write(f'{el}\n')
+
+
+class ColumnBatcher:
+    """
+    Build DataFrame from streamed records without per-row inserts:
+    values are collected to per-column lists and flushed as DataFrame chunks
+    of fixed size, final DataFrame is concatenated once
+    """
+    def __init__(self, columns, chunk_size=config.chunk_size, prepare=None, sink=None, keep=True):
+        """
+        :param columns: list of column names, records must follow the same order
+        :param chunk_size: number of rows in one chunk
+        :param prepare: function(chunk) -> chunk, applied once per flushed chunk
+        :param sink: function(chunk) called for every flushed chunk, e.g. storage.ResultWriter.write
+        :param keep: keep chunks in memory to get final DataFrame with frame()
+        """
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.prepare = prepare
+        self.sink = sink
+        self.keep = keep
+        self.chunks = []
+        self.flushed = 0
+        self.rows = 0
+        self.buffer = self._empty_buffer()
+
+    def _empty_buffer(self):
+        return {column: [] for column in self.columns}
+
+    def append(self, record):
+        for column, value in zip(self.columns, record):
+            self.buffer[column].append(value)
+        self.rows += 1
+        if len(self.buffer[self.columns[0]]) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        # Empty chunk is flushed only once to get header and columns
+        if not self.buffer[self.columns[0]] and self.flushed:
+            return
+        chunk = pd.DataFrame(self.buffer, columns=self.columns)
+        self.buffer = self._empty_buffer()
+        if self.prepare is not None:
+            chunk = self.prepare(chunk)
+        if self.sink is not None:
+            self.sink(chunk)
+        if self.keep:
+            self.chunks.append(chunk)
+        self.flushed += 1
+
+    def frame(self):
+        """Flush the rest of records and get resulting DataFrame"""
+        self.flush()
+        if not self.keep:
+            return None
+        return storage.concat_frames(self.chunks)
+
+
+def list_json_files(dataset_path):
+    """List all .json part files in dataset folder, sorted to keep fixed order"""
+    return sorted([os.path.join(dataset_path, ijson) for ijson in os.listdir(dataset_path) if ijson.endswith(".json")])
+
+
+def list_part_files(dataset_path):
+    """
+    List dataset part files, sorted to keep fixed order
+    Parquet part files are taken if dataset folder has them, .json files otherwise
+    """
+    parquet_files = sorted([os.path.join(dataset_path, iparquet) for iparquet in os.listdir(dataset_path) if iparquet.endswith(".parquet")])
+    return parquet_files or list_json_files(dataset_path)
+
+
+def is_parquet(part):
+    return part.endswith(".parquet")
+
+
+def read_parquet_part(part, columns):
+    """Read only needed columns from parquet part file, needs pyarrow"""
+    return pd.read_parquet(part, columns=list(columns))
+
+
+def map_parts(parse_part, parts, workers=1):
+    """
+    Sharded reader: run parse_part on every part file, one task per file
+    Part files are independent, so with workers > 1 they are parsed in a pool of processes
+    :param parse_part: picklable function(part) -> partial result
+    :param parts: list of part files
+    :param workers: number of worker processes, 1 - parse sequentially in current process
+    :return: generator of partial results in the same order as parts, each one is given as soon as
+             its part is parsed: caller consumes it while next parts are parsed, results are not collected
+    """
+    workers = min(workers, len(parts))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(parse_part, parts, chunksize=1)
+    else:
+        for part in parts:
+            yield parse_part(part)
+
+
+def cli_args(description=None):
+    """Common command line options for discovery scripts"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--workers', type=int, default=config.workers,
+                        help='number of processes to parse dataset part files (default: %(default)s)')
+    return parser.parse_args()
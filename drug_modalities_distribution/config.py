@@ -14,6 +14,38 @@ results_dir = os.path.join(project_root, 'results')
 html_dir = os.path.join(project_root, 'html')
 sc_file = os.path.join(datasets_dir, "subcell_uniprot.txt")
 
+# Parsing
+# Rows kept in memory by ColumnBatcher before flushing a DataFrame chunk
+chunk_size = 100_000
+# Processes for parsing dataset part files, 1 - sequential parsing
+workers = 1
+
+# Merge
+# Memory budget for out-of-core merge, MB: inputs are hash partitioned on disk and joined bucket by bucket,
+# None - merge in memory
+merge_memory = None
+# Hash partitions of out-of-core merge
+merge_buckets = 64
+
+# Intermediate results
+# Format: "feather" | "parquet" | "csv", binary formats keep dtypes and need pyarrow
+results_format = "feather"
+# Also write .csv copy of every result to open it by hand
+results_csv = False
+# Database every result is loaded to for indexed queries (query.py): "sqlite" | None to skip loading
+results_db = None
+results_db_file = os.path.join(results_dir, 'results.sqlite')
+# Seconds to wait for database locked by other process
+results_db_timeout = 60
+
 # Plotting
 template = "plotly_white"
 # template = "plotly_dark"
+
+# Dash server
+dash_host = "0.0.0.0"
+dash_port = 8050
+# WSGI server (gunicorn) worker processes, datasets are loaded once and shared by them
+dash_workers = 4
+# Result downloads streamed at once by each server process, chunk rows: chunk_size
+download_threads = 2
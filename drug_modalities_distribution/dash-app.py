@@ -1,19 +1,8 @@
-import dash
-from dash import Dash, html, dcc
-
-
-app = Dash(__name__, use_pages=True)
-
-app.layout = html.Div([
-    html.H1('Info'),
-    html.Div([
-        html.Div(
-            dcc.Link(f"{page['name']}", href=page["relative_path"])
-        ) for page in dash.page_registry.values()
-    ]),
-    dash.page_container
-])
+import config as config
+from wsgi import app
 
 
+# Development server, single process
+# Multiple processes: gunicorn -c gunicorn.conf.py wsgi:server
 if __name__ == '__main__':
-    app.run()
+    app.run(host=config.dash_host, port=config.dash_port)
@@ -1,8 +1,10 @@
 #!/bin/bash
 
-mkdir ../results ../html
+mkdir -p ../results ../html
 
-python3 dash-app.py
-python3 dash-app-dmd.py
-
-cd ../results ; for ilog in drug*.log moa*.log target*.log merge*.log ; do cat ${ilog} >> dmd.log ; done ; cd ..
\ No newline at end of file
+# Single server for all pages, several worker processes if gunicorn is installed
+if command -v gunicorn > /dev/null ; then
+    gunicorn -c gunicorn.conf.py wsgi:server
+else
+    python3 dash-app.py
+fi
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import dash
+from dash import html, dcc, Input, Output
+from figures import figure_cache
+
+
+fig_height = '900px'
+
+# How often page asks if its figures are ready, ms
+poll_interval = 1000
+
+
+def figures_layout(result):
+    """Graphs for built figures of page"""
+    content = [html.Div([dcc.Graph(figure=fig, responsive=True, style={'height': fig_height}), ])
+               for fig in result['figures']]
+    if result.get('info'):
+        content.append(html.Pre(result['info']))
+    return content
+
+
+def pending_layout(page):
+    """Loading state while figures are built"""
+    error = figure_cache.error(page)
+    if error:
+        return [html.P(f'Failed to build {page} figures:'), html.Pre(error)]
+    return [html.P(f'Building {page} figures, {figure_cache.elapsed(page):.0f}s...'),
+            dcc.Loading(html.Div(), type='circle')]
+
+
+def figure_page(page, title):
+    """
+    Layout function for page with figures from process-wide figure cache
+    Cached figures are shown at once, first poll of page starts build in background thread
+    and page polls until figures are ready: server start does not wait for datasets parsing
+    Figures are built for current dataset version from persisted figures or results if they are up to date,
+    Rebuild button parses datasets anyway
+    :param page: drug | moa | target | dmd
+    :param title: page header
+    :return: layout function for dash.register_page
+    """
+    content_id, poll_id, rebuild_id = f'{page}-figures', f'{page}-poll', f'{page}-rebuild'
+
+    @dash.callback(Output(content_id, 'children'),
+                   Output(poll_id, 'disabled'),
+                   Input(poll_id, 'n_intervals'),
+                   prevent_initial_call=True)
+    def poll(n_intervals):
+        # Failed build is not restarted until page is reloaded
+        if not figure_cache.error(page):
+            figure_cache.start(page)
+        if figure_cache.ready(page):
+            return figures_layout(figure_cache.get(page)), True
+        return pending_layout(page), figure_cache.error(page) is not None
+
+    @dash.callback(Output(content_id, 'children', allow_duplicate=True),
+                   Output(poll_id, 'disabled', allow_duplicate=True),
+                   Input(rebuild_id, 'n_clicks'),
+                   prevent_initial_call=True)
+    def rebuild(n_clicks):
+        figure_cache.rebuild(page)
+        return pending_layout(page), False
+
+    def layout(**kwargs):
+        # Dash also calls layout on start to validate callbacks: build is started by first poll only
+        if figure_cache.ready(page):
+            content, waiting = figures_layout(figure_cache.get(page)), False
+        else:
+            figure_cache.reset_error(page)
+            content, waiting = pending_layout(page), True
+        return html.Div([
+            html.H3(title),
+            html.Button('Rebuild', id=rebuild_id, title='Parse datasets and build figures again'),
+            html.Div(content, id=content_id),
+            dcc.Interval(id=poll_id, interval=poll_interval, disabled=not waiting),
+        ])
+
+    return layout
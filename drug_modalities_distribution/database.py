@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import pandas as pd
+import config as config
+
+
+# Columns indexed in every result table that has them
+indexed_columns = ('drugId', 'targetId', 'drugType', 'targetLocationCluster')
+
+
+def sql_type(dtype):
+    if pd.api.types.is_integer_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def sql_rows(chunk):
+    """Rows of chunk as tuples of python values, None for missing ones"""
+    values = chunk.astype(object)
+    return values.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+class ResultDatabase(ABC):
+    """
+    Database results are loaded to for indexed queries, see query.py
+    Backend implements load and read, e.g. over PostgreSQL connection pool
+    """
+    @abstractmethod
+    def load(self, name, chunks):
+        """
+        Replace table of result with rows of chunks at once: readers see old or new table only
+        :param name: result name, table name
+        :param chunks: iterable of DataFrame chunks with same columns
+        :return: number of loaded rows
+        """
+
+    @abstractmethod
+    def read(self, sql, params=()):
+        """
+        Query result tables
+        :return: DataFrame
+        """
+
+
+class SQLiteDatabase(ResultDatabase):
+    """Results in embedded SQLite database file, no server needed"""
+    def __init__(self, path=None):
+        self.path = path or config.results_db_file
+
+    def connect(self, read_only=False):
+        if read_only:
+            return sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=config.results_db_timeout)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=config.results_db_timeout, isolation_level=None)
+        # Readers are not blocked by loads
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def load(self, name, chunks):
+        connection = self.connect()
+        new_table, loaded = f'{name}__new', 0
+        try:
+            # One transaction for whole result: batched inserts and table swap
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(f'DROP TABLE IF EXISTS "{new_table}"')
+            columns = None
+            for chunk in chunks:
+                if columns is None:
+                    columns = list(chunk.columns)
+                    definition = ', '.join(f'"{column}" {sql_type(chunk[column].dtype)}' for column in columns)
+                    connection.execute(f'CREATE TABLE "{new_table}" ({definition})')
+                placeholders = ', '.join('?' * len(columns))
+                connection.executemany(f'INSERT INTO "{new_table}" VALUES ({placeholders})', sql_rows(chunk[columns]))
+                loaded += len(chunk.index)
+            if columns is None:
+                connection.execute('ROLLBACK')
+                return 0
+
+            connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+            connection.execute(f'ALTER TABLE "{new_table}" RENAME TO "{name}"')
+            for column in indexed_columns:
+                if column in columns:
+                    connection.execute(f'CREATE INDEX "{name}_{column}" ON "{name}" ("{column}")')
+            connection.execute('COMMIT')
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+        return loaded
+
+    def read(self, sql, params=()):
+        connection = self.connect(read_only=True)
+        try:
+            return pd.read_sql_query(sql, connection, params=params)
+        finally:
+            connection.close()
+
+
+# Backend name: class, see config.results_db
+backends = {'sqlite': SQLiteDatabase}
+
+
+def database():
+    """Configured results database, None if results are not loaded to database"""
+    if not config.results_db:
+        return None
+    if config.results_db not in backends:
+        raise ValueError(f'Unknown results database "{config.results_db}", choose from {list(backends)}')
+    return backends[config.results_db]()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import argparse
+import pandas as pd
+import discover_drug
+import discover_moa
+import discover_target
+from common import Log
+from plotter import Plotter
+from schema import apply_schema
+from storage import read_frame
+
+
+# Plots of discovery results, separate from parsing: plotting changes do not make datasets parsed again
+
+
+def drug_info(workers=1, from_results=False):
+    """
+    :param workers: number of processes to parse part files
+    :param from_results: take drug result from previous run instead of parsing dataset
+    """
+    # Get dataframe from initial dataset
+    if from_results:
+        df_drug = apply_schema(read_frame('drug'), 'drug')
+    else:
+        df_drug = discover_drug.parse_drug(workers=workers)
+
+    # Drug type distribution
+    ag = df_drug.groupby("drugType", as_index=False, observed=True).drugId.count()
+
+    # Initiate Plotter class
+    plotter = Plotter(job='drug')
+    # Get color schemes from Plotter
+
+    # Drug type distribution
+    title = 'Drug modalities in starting dataset'
+
+    # Plot histogram
+    fig1 = plotter.plot_hist(idf=ag, title=f'{title}_hist')
+
+    # Plot pie-chart
+    fig2 = plotter.plot_pie_chart(idf=ag, color_map="modality",
+                                  title=f'{title}_pie')
+
+    return fig1, fig2
+
+
+def moa_info(workers=1, from_results=False):
+    """
+    :param workers: number of processes to parse part files
+    :param from_results: take drugs/targets ratio from previous run instead of parsing dataset
+    """
+    # Get dataframe from initial dataset
+    # my_mode = "single_target"
+    if from_results:
+        info_df = read_frame('moa_info')
+    else:
+        dataset_df, info_df = discover_moa.parse_moa(workers=workers)
+
+    # Get pivot: items count per drugs/targets ratio
+    ag = info_df[['numTargets', 'numDrugs', 'count']].sort_values(['numTargets', 'numDrugs']).reset_index(drop=True)
+    ag["numDrugs"] = ag["numDrugs"].astype(str)
+
+    # Plot
+    plotter = Plotter(job="moa")
+    # MoA: drugs/targets in initial entities
+    params = {"xaxis_title": "Targets per 1 entity",
+              "yaxis_title": "Number of items",
+              "legend_title": "Drugs per 1 entity"}
+
+    fig = plotter.plot_scatter(idf=ag, log_y=False,
+                               title="MoA: drug to target ratio in initial items")
+    fig.update_layout(params)
+    # fig.show()
+
+    return fig
+
+
+def target_info(workers=1, from_results=False):
+    """
+    :param workers: number of processes to parse part files
+    :param from_results: take target results of previous run instead of parsing dataset
+    """
+    ########
+    # RUN
+    ########
+
+    # Get all data
+    if from_results:
+        info_df = read_frame('target_info')
+        dataset_df = apply_schema(read_frame('target'), 'target')
+        locations_counter = discover_target.count_locations(dataset_df)
+    else:
+        info_df, dataset_df, locations_counter = discover_target.parse_targets(workers=workers)
+
+
+    #################
+    # BIOTYPE
+    #################
+
+    biotype_nlocs = info_df.groupby(["targetBiotype", "numLocations"]).targetId.count().reset_index()
+
+    # Get plotter
+    plotter = Plotter(job="target")
+
+    # Plot zero-location / biotype distribution
+    zero = biotype_nlocs[biotype_nlocs.numLocations == 0]
+    fig1 = plotter.plot_hist(idf=zero, title="Targets dataset: Targets with zero locations")
+
+    # Plot nonzero-location / biotype distribution
+    non_zero = biotype_nlocs[biotype_nlocs.numLocations > 0]
+    # TODO: add single bar coloring for "protein_coding" (color_discrete_map={"protein_coding": "red"})
+    fig2 = plotter.plot_hist(idf=non_zero, title="Targets dataset: Targets with non-zero locations")
+
+    #################
+    # LOCATIONS COUNT
+    #################
+
+    # Plot locations distribution
+    locations = info_df.groupby("numLocations").targetId.count().reset_index()
+    fig3 = plotter.plot_hist(idf=locations, title="Targets dataset: Locations count distribution", nbins=max(list(info_df.numLocations))+1)
+
+    locations_df = pd.DataFrame(dict(categories=locations_counter.keys(), count=locations_counter.values()))
+    fig4 = plotter.plot_hist(idf=locations_df, title="Targets dataset: Locations distribution hist")
+    fig5 = plotter.plot_pie_chart(idf=locations_df,
+                                  title="Targets dataset: Locations distribution",
+                                  color_map="cluster")
+
+    return fig1, fig2, fig3, fig4, fig5
+
+
+# Dataset: plots of its discovery results
+infos = {'drug': drug_info, 'moa': moa_info, 'target': target_info}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plots of discovery results")
+    parser.add_argument('dataset', choices=list(infos), help='dataset which results are plotted')
+    args = parser.parse_args()
+
+    infos[args.dataset](from_results=True)
+    Log(job=f'{args.dataset}_plot').get_log(info=f'{args.dataset}: plots of discovery results written')
@@ -1,19 +1,83 @@
 #!/usr/bin/env python3
 
 import os
-import io
-import pandas as pd
-import json
-from common import Log
+from projection import json_project
+from common import Log, ColumnBatcher, list_part_files, is_parquet, read_parquet_part, map_parts, cli_args
 import config as config
-from plotter import Plotter
+from storage import ResultWriter
+from schema import apply_schema
+
+
+# Keys to get from records
+drug_keys = ('id', 'name', 'drugType')
 
 
 ############################
 # Parse original datasets #
 ############################
 
-def parse_drug():
+def drug_records(json_path):
+    """
+    Generator over all lines in dataset .json file
+    :return: (drugId, [drugId, drugName, drugType]) or (drugId, None) if some keys not found
+    """
+    with open(json_path, encoding="UTF-8") as json_file:
+        for line_number, line in enumerate(json_file):
+            # Decode only needed fields
+            record = json_project(line, drug_keys)
+
+            # get values
+            drug_id = record['id']
+
+            try:
+                row = [drug_id, record['name'], record['drugType']]
+
+            except KeyError:
+                print(f'\nSome keys not found! for {drug_id} in'
+                      f' {json_file}: line {line_number}\n')
+                row = None
+
+            yield drug_id, row
+
+
+def parse_drug_parquet(parquet_path):
+    """
+    Parse single parquet part file, only needed columns are read
+    :return: (rows, failed drugIds) as for .json part file
+    """
+    df = read_parquet_part(parquet_path, columns=drug_keys)
+    complete = df['name'].notna() & df['drugType'].notna()
+    failed = df['id'][~complete].tolist()
+    for drug_id in failed:
+        print(f'\nSome keys not found! for {drug_id} in {parquet_path}\n')
+    rows = df.loc[complete, list(drug_keys)].values.tolist()
+    return rows, failed
+
+
+def parse_drug_part(part_path):
+    """
+    Parse single part file
+    :return: (rows, failed drugIds)
+    """
+    if is_parquet(part_path):
+        return parse_drug_parquet(part_path)
+
+    rows, failed = [], []
+    for drug_id, row in drug_records(part_path):
+        if row is None:
+            failed.append(drug_id)
+        else:
+            rows.append(row)
+    return rows, failed
+
+
+def normalize_drug_type(chunk):
+    """Avoid uncertainty: single notation for unknown drug type, then set dtypes from schema"""
+    chunk['drugType'] = chunk['drugType'].replace('unknown', 'Unknown')
+    return apply_schema(chunk, 'drug')
+
+
+def parse_drug(workers=1):
     dataset = "drug"
 
     # Initiate logger
@@ -29,46 +93,28 @@ def parse_drug():
     # Fields in final DataFrame
     result = ['drugId', 'drugName', 'drugType']
 
-    # List all .json files in folder
-    json_files = sorted([ijson for ijson in os.listdir(os.path.join(base_path, dataset_dir)) if ijson.endswith(".json")])
+    # List all .parquet or .json files in folder
+    part_files = list_part_files(os.path.join(base_path, dataset_dir))
 
-    # define pandas Dataframe with the columns to get from the json
-    dataset_df = pd.DataFrame(columns=result)
+    # Collect columns in batches, every batch is passed to result writer right away
+    writer = ResultWriter(name=dataset)
+    batcher = ColumnBatcher(columns=result, prepare=normalize_drug_type, sink=writer.write)
 
     # run through all files/lines
     count = 0
     failed = []
     taken = []
 
-    for index, js in enumerate(json_files):
-        with open(os.path.join(base_path, dataset_dir, js), encoding="UTF-8") as json_file:
-            for line_number, line in enumerate(json_file):
-                count +=1
-                line_as_file = io.StringIO(line)
-                # Use a new parser for each line
-                record = json.load(line_as_file)
-
-                # get values
-                drug_id = record['id']
-
-                try:
-                    drug_type = record['drugType']
-                    # Avoid uncertainty
-                    if drug_type == "unknown":
-                        drug_type = "Unknown"
-                    drug_name = record['name']
-                    taken.append(drug_id)
+    # Partial results come in files order
+    for rows, part_failed in map_parts(parse_drug_part, part_files, workers=workers):
+        count += len(rows) + len(part_failed)
+        failed.extend(part_failed)
+        taken.extend(row[0] for row in rows)
+        batcher.extend(rows)
 
-                    # add to DataFrame
-                    dataset_df.loc[count] = [drug_id, drug_name, drug_type]
-
-                except KeyError:
-                    print(f'\nSome keys not found! for {drug_id} in'
-                          f' {json_file}: line {line_number}\n')
-                    failed.append(drug_id)
-
-    # Write csv with resulting df
-    out_file = log.write_csv(dataset_df=dataset_df)
+    # Resulting df, result is written chunk by chunk
+    dataset_df = batcher.frame()
+    out_file = writer.close()
 
     # Summary
     info = f'\n' \
@@ -86,30 +132,6 @@ def parse_drug():
     return dataset_df
 
 
-def get_info():
-
-    # Get dataframe from initial dataset
-    df_drug = parse_drug()
-
-    # Drug type distribution
-    ag = df_drug.groupby("drugType", as_index=False).drugId.count()
-
-    # Initiate Plotter class
-    plotter = Plotter(job='drug')
-    # Get color schemes from Plotter
-
-    # Drug type distribution
-    title = 'Drug modalities in starting dataset'
-
-    # Plot histogram
-    fig1 = plotter.plot_hist(idf=ag, title=f'{title}_hist')
-
-    # Plot pie-chart
-    fig2 = plotter.plot_pie_chart(idf=ag, color_map="modality",
-                                  title=f'{title}_pie')
-
-    return fig1, fig2
-
-
 if __name__ == "__main__":
-    get_info()
+    args = cli_args(description="Discovery on MOLECULE dataset")
+    parse_drug(workers=args.workers)
@@ -1,107 +1,162 @@
 #!/usr/bin/env python3
 
 import os
-import io
 import pandas as pd
-import json
-import plotly.express as px
+from functools import partial
 from collections import Counter
-from common import Log
+from projection import json_project
+from common import Log, list_part_files, is_parquet, read_parquet_part, map_parts, cli_args
 import config as config
-from plotter import Plotter
+from schema import apply_schema
+from storage import write_frame
 
 
 # Primary keys
 # ['actionType', 'chemblIds', 'mechanismOfAction', 'references', 'targetName', 'targetType', 'targets']
 
+# Keys to get from records
+moa_keys = ('chemblIds', 'targets')
+
 
 ############################
 # Parse original datasets #
 ############################
 
-def parse_moa(mode="multi_target"):
-    dataset = "moa"
-    base_path = config.datasets_dir
-    dataset_dir = 'mechanismOfAction'
-    # Fields in final DataFrame
-    result = ['drugId', 'targetId']
+def parse_moa_parquet(parquet_path, mode="multi_target"):
+    """
+    Parse single parquet part file, only needed columns are read, lists are exploded in columnar form
+    :return: dict as for .json part file
+    """
+    df = read_parquet_part(parquet_path, columns=moa_keys)
+    chembl_ids = df['chemblIds'].map(list)
+    targets = df['targets'].map(lambda itargets: [] if itargets is None else list(itargets))
+    num_drugs, num_targets = chembl_ids.map(len), targets.map(len)
 
-    # Initiate logger
-    log = Log(job=dataset)
-    info = f'\n' \
-           f'{"#" * 100}\n\n' \
-           f'Running discovery on {dataset.upper()} dataset\n\n' \
-           f'{"#" * 100}\n\n'
-    log.get_log(info=info)
+    # Drugs/targets count in entities
+    ratio = Counter(pd.DataFrame(dict(numDrugs=num_drugs, numTargets=num_targets)).value_counts().to_dict())
+
+    # Second molecules in pairs are alternative forms
+    alternative = dict.fromkeys(chembl_ids[num_drugs == 2].str[-1])
+
+    if mode == "single_target":
+        # TODO: single target choose logic from MoA data
+        targets = targets.str[:1]
 
-    # List all .json files in folder
-    json_files = sorted([ijson for ijson in os.listdir(os.path.join(base_path, dataset_dir)) if ijson.endswith(".json")])
+    # First drug to all its targets, unique pairs in first-seen order
+    pairs = pd.DataFrame(dict(drugId=chembl_ids.str[0], targetId=targets)).explode('targetId').dropna()
+    unique = dict.fromkeys(zip(pairs['drugId'], pairs['targetId']))
 
-    # Setup counters and aggregate lists
-    count, taken, zero_targets, ijson = 0, 0, 0, 0
-    alternative = []
+    return dict(count=len(df.index), taken=len(pairs.index), zero_targets=int((num_targets == 0).sum()),
+                ratio=ratio, pairs=unique, alternative=alternative)
 
-    # define pandas Dataframe with the columns to get from the json
-    dataset_df = pd.DataFrame(columns=result)
-    info_df = pd.DataFrame(columns=['numDrugs', 'numTargets'])
 
-    for index, js in enumerate(json_files):
-        cursor = 0
-        ijson += 1
-        with open(os.path.join(base_path, dataset_dir, js), encoding="UTF-8") as json_file:
-            for line_number, line in enumerate(json_file):
-                count += 1
-                cursor += 1
-                print(f'json: {ijson}/{len(json_files)}, line: {cursor}, parsed items: {count}')
+def parse_moa_part(part_path, mode="multi_target"):
+    """
+    Parse single part file, drug-target pairs are deduplicated while streaming
+    :return: dict with partial counters, drugs/targets ratio counter, unique drug-target pairs and alternative forms
+    """
+    if is_parquet(part_path):
+        return parse_moa_parquet(part_path, mode=mode)
 
-                line_as_file = io.StringIO(line)
-                # Use a new parser for each line
-                record = json.load(line_as_file)
+    part = dict(count=0, taken=0, zero_targets=0, ratio=Counter(), pairs={}, alternative={})
+    # Dicts as ordered sets: O(1) membership and first-seen order
+    pairs = part["pairs"]
+    alternative = part["alternative"]
 
-                # Get information about drugs/targets count in entities
-                numDrugs, numTargets = record["chemblIds"].__len__(), record["targets"].__len__()
-                info_df.loc[count] = [numDrugs, numTargets]
+    with open(part_path, encoding="UTF-8") as json_file:
+        for line in json_file:
+            part["count"] += 1
 
-                # DRUGS
+            # Decode only needed fields
+            record = json_project(line, moa_keys)
 
-                # Get [duplicates: list of drugIds for second molecules in pairs
-                # they have common targets and will not get new information
-                if record["chemblIds"].__len__() == 2:
-                    second = record["chemblIds"][-1]
-                    if second not in alternative:
-                        alternative.append(second)
+            # Get information about drugs/targets count in entities
+            numDrugs, numTargets = record["chemblIds"].__len__(), record["targets"].__len__()
+            part["ratio"][(numDrugs, numTargets)] += 1
 
-                # If we have 2 drugs we take only first - usually it's salt and have more target data
-                drug_id = record["chemblIds"][0]
+            # DRUGS
 
-                # TARGETS
-                targets = record["targets"]
-                if len(targets) > 0:
+            # Get [duplicates: list of drugIds for second molecules in pairs
+            # they have common targets and will not get new information
+            if record["chemblIds"].__len__() == 2:
+                alternative.setdefault(record["chemblIds"][-1])
 
-                    if mode == "single_target":
-                        # TODO: single target choose logic from MoA data
-                        # temporary take first in list just to try
-                        targets = [targets[0], ]
+            # If we have 2 drugs we take only first - usually it's salt and have more target data
+            drug_id = record["chemblIds"][0]
 
-                    # Get final DataFrame
-                    for target_id in targets:
-                        taken += 1
-                        dataset_df.loc[taken] = [drug_id, target_id]
+            # TARGETS
+            targets = record["targets"]
+            if len(targets) > 0:
 
-                else:
-                    zero_targets += 1
+                if mode == "single_target":
+                    # TODO: single target choose logic from MoA data
+                    # temporary take first in list just to try
+                    targets = [targets[0], ]
 
-    # Deduplicate
-    before = len(dataset_df)
-    dataset_df.drop_duplicates(inplace=True)
-    after_deduplicate = len(dataset_df.index)
+                # Keep unique pairs only
+                for target_id in targets:
+                    part["taken"] += 1
+                    pairs.setdefault((drug_id, target_id))
 
-    # Drop rows with alternative forms of drugs
-    dataset_df = dataset_df[~dataset_df['drugId'].isin(alternative)]
-    after_pop_alternative = len(dataset_df.index)
+            else:
+                part["zero_targets"] += 1
 
-    # Write csv with resulting df
-    out_file = log.write_csv(dataset_df=dataset_df)
+    return part
+
+
+def parse_moa(mode="multi_target", workers=1):
+    dataset = "moa"
+    base_path = config.datasets_dir
+    dataset_dir = 'mechanismOfAction'
+    # Fields in final DataFrame
+    result = ['drugId', 'targetId']
+
+    # Initiate logger
+    log = Log(job=dataset)
+    info = f'\n' \
+           f'{"#" * 100}\n\n' \
+           f'Running discovery on {dataset.upper()} dataset\n\n' \
+           f'{"#" * 100}\n\n'
+    log.get_log(info=info)
+
+    # List all .parquet or .json files in folder
+    part_files = list_part_files(os.path.join(base_path, dataset_dir))
+
+    # Setup counters and aggregate sets
+    count, taken, zero_targets = 0, 0, 0
+    ratio = Counter()
+    alternative = {}
+    pairs = {}
+
+    # Partial results come in files order, first seen pair is kept as in drop_duplicates
+    parts = map_parts(partial(parse_moa_part, mode=mode), part_files, workers=workers)
+    for part_file, part in zip(part_files, parts):
+        log.get_log(info=f'{os.path.basename(part_file)}: {part["count"]:,} items')
+        count += part["count"]
+        zero_targets += part["zero_targets"]
+        taken += part["taken"]
+        ratio.update(part["ratio"])
+        pairs.update(part["pairs"])
+        alternative.update(part["alternative"])
+
+    # Deduplicated while streaming
+    before = taken
+    after_deduplicate = len(pairs)
+
+    # Drop pairs with alternative forms of drugs
+    saved = [pair for pair in pairs if pair[0] not in alternative]
+    after_pop_alternative = len(saved)
+
+    # Final DataFrame is built once
+    dataset_df = apply_schema(pd.DataFrame(saved, columns=result), 'moa')
+
+    # Information about drugs/targets count in entities
+    info_df = pd.DataFrame([[num_drugs, num_targets, num_items] for (num_drugs, num_targets), num_items in sorted(ratio.items())],
+                           columns=['numDrugs', 'numTargets', 'count'])
+
+    # Write resulting df, drugs/targets ratio is kept for plots
+    out_file = log.write_result(dataset_df=dataset_df)
+    write_frame(info_df, 'moa_info')
 
     # Summary
     info = f'\n' \
@@ -118,29 +173,6 @@ def parse_moa(mode="multi_target"):
     return dataset_df, info_df
 
 
-def get_info():
-    # Get dataframe from initial dataset
-    # my_mode = "single_target"
-    dataset_df, info_df = parse_moa()
-
-    # Get pivot
-    ag = info_df.groupby('numTargets').numDrugs.value_counts().sort_index().reset_index()
-    ag["numDrugs"] = ag["numDrugs"].astype(str)
-
-    # Plot
-    plotter = Plotter(job="moa")
-    # MoA: drugs/targets in initial entities
-    params = {"xaxis_title": "Targets per 1 entity",
-              "yaxis_title": "Number of items",
-              "legend_title": "Drugs per 1 entity"}
-
-    fig = plotter.plot_scatter(idf=ag, log_y=False,
-                               title="MoA: drug to target ratio in initial items")
-    fig.update_layout(params)
-    # fig.show()
-
-    return fig
-
-
 if __name__ == "__main__":
-    get_info()
+    args = cli_args(description="Discovery on MOA dataset")
+    parse_moa(workers=args.workers)
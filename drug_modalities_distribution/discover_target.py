@@ -1,16 +1,14 @@
 #!/usr/bin/env python3
 
 import os
-import io
 import pandas as pd
-import json
-import plotly.express as px
-from collections import Counter
 
+from projection import json_project
 from subcellular_parse import SubcellularUniprot
 import config as config
-from common import Log
-from plotter import Plotter
+from common import Log, list_part_files, is_parquet, read_parquet_part, map_parts, cli_args
+from schema import apply_schema
+from storage import write_frame
 
 
 # Target primary keys
@@ -22,6 +20,9 @@ tar_prim_keys = ['approvedName', 'approvedSymbol', 'biotype', 'canonicalExons',
                  'symbolSynonyms', 'synonyms', 'targetClass', 'tractability',
                  'transcriptIds']
 
+# Keys to get from records
+target_keys = ('id', 'biotype', 'subcellularLocations')
+
 
 # Get SC code2name dict
 
@@ -32,7 +33,110 @@ sc = SubcellularUniprot()
 ############################
 
 
-def parse_targets():
+def parse_targets_parquet(parquet_path):
+    """
+    Phase 1 for single parquet part file: only needed columns are read, locations are exploded in columnar form
+    :return: dict as for .json part file
+    """
+    df = read_parquet_part(parquet_path, columns=target_keys)
+    items = df['subcellularLocations'].map(lambda iitems: [] if iitems is None else list(iitems))
+    records = list(range(len(df.index)))
+
+    info = dict(record=records, targetId=df['id'].tolist(), targetBiotype=df['biotype'].tolist(),
+                numLocations=items.map(len).tolist())
+
+    exploded = pd.DataFrame(dict(record=records, targetId=df['id'], item=items)).explode('item').dropna(subset=['item'])
+    fields = pd.DataFrame(exploded['item'].tolist(), columns=['source', 'termSL', 'location'])
+    locs = dict(record=exploded['record'].tolist(), targetId=exploded['targetId'].tolist(),
+                source=fields['source'].tolist(), termSL=fields['termSL'].tolist(), location=fields['location'].tolist())
+
+    return dict(count=len(df.index), info=info, locs=locs)
+
+
+def parse_targets_part(part_path):
+    """
+    Phase 1: stream raw data of single part file to columnar buffers
+    :return: dict with records count, target info columns and location items columns
+    """
+    if is_parquet(part_path):
+        return parse_targets_parquet(part_path)
+
+    count = 0
+    info = dict(record=[], targetId=[], targetBiotype=[], numLocations=[])
+    locs = dict(record=[], targetId=[], source=[], termSL=[], location=[])
+
+    with open(part_path, encoding="UTF-8") as json_file:
+        for line in json_file:
+            # Decode only needed fields
+            record = json_project(line, target_keys)
+
+            # Main key
+            target_id = record['id']
+            target_biotype = record['biotype']
+            # Zero locations if there is no key
+            items = record.get('subcellularLocations', [])
+
+            # Keep info for common description of dataset
+            info['record'].append(count)
+            info['targetId'].append(target_id)
+            info['targetBiotype'].append(target_biotype)
+            info['numLocations'].append(len(items))
+
+            # Raw location items, all processing is done in phase 2
+            for item in items:
+                locs['record'].append(count)
+                locs['targetId'].append(target_id)
+                locs['source'].append(item.get('source'))
+                locs['termSL'].append(item.get('termSL'))
+                locs['location'].append(item.get('location'))
+
+            count += 1
+
+    return dict(count=count, info=info, locs=locs)
+
+
+def annotate_locations(locs_df):
+    """
+    Phase 2: vectorized processing of all location items
+    :param locs_df: DataFrame of raw location items from parse_targets_part
+    :return: (DataFrame of unique SL codes per target with names and clusters,
+              number of uniprot items without SL code, non-standart locations)
+    """
+    # Delete Isoform data in location field like '[Isoform p56]: Nucleus'
+    clean = locs_df['location'].str.split(":").str[-1].str.strip()
+
+    # Get all "non-standart" locations: not in Subcellular Uniprot codes
+    #TODO: do we need this information?
+    named = locs_df['location'].notna() & (locs_df['location'] != '')
+    not_standart = clean[named & ~clean.isin(list(sc.name_code))]
+
+    # SL codes for all locations from "Term_SL" field, Uniprot source only
+    uniprot = locs_df['source'] == 'uniprot'
+    without_sl_code = uniprot & locs_df['termSL'].isna()
+
+    # Try to get location if there is no "TermSL" data
+    try_sl_code = sc.translate_list(clean[without_sl_code])
+    for target_id, sl_code in zip(locs_df['targetId'][try_sl_code.index[try_sl_code.notna()]], try_sl_code.dropna()):
+        print(f"! Got SL from location yet Term_SL is empty! {target_id}: {sl_code}")
+    not_standart = pd.concat([not_standart, clean[without_sl_code][try_sl_code.isna()]]).drop_duplicates()
+
+    terms = locs_df['termSL'].where(~without_sl_code, try_sl_code)
+    keep = uniprot & terms.notna()
+
+    # Keep only unique locations of every target, in order of appearance
+    dataset_df = pd.DataFrame(dict(record=locs_df['record'][keep],
+                                   targetId=locs_df['targetId'][keep],
+                                   targetLocation=terms[keep]))
+    dataset_df = dataset_df.drop_duplicates(subset=['record', 'targetLocation'])
+
+    # Annotate with names and clusters
+    dataset_df['targetLocationName'] = sc.translate_list(dataset_df['targetLocation'])
+    dataset_df['targetLocationCluster'] = sc.get_cluster_list(dataset_df['targetLocation'])
+
+    return dataset_df, int(without_sl_code.sum()), not_standart
+
+
+def parse_targets(workers=1):
     """" Parse json files with datasets to pandas DataFrame"""
     dataset = "target"
     print(f'Running discovery on {dataset.upper()} dataset\n\n')
@@ -50,109 +154,42 @@ def parse_targets():
     # Fields in final DataFrame
     result = ['targetId', 'targetLocation', 'targetLocationName', 'targetLocationCluster']
 
-    # List all .json files in folder
-    json_files = sorted([ijson for ijson in os.listdir(os.path.join(base_path, dataset_dir)) if ijson.endswith(".json")])
+    # List all .parquet or .json files in folder
+    part_files = list_part_files(os.path.join(base_path, dataset_dir))
 
-    # Setup counters and aggregate lists
+    # Phase 1: raw columns from all files, partial results come in files order
     count = 0
-    locations = []
-    count_targets = 0
-    count_locs = 0
-    not_standart = []
-    locs_without_sl_code = 0
-    ijson = 0
+    info_parts, locs_parts = [], []
+    for part_file, part in zip(part_files, map_parts(parse_targets_part, part_files, workers=workers)):
+        log.get_log(info=f'{os.path.basename(part_file)}: {part["count"]:,} targets')
+        # Records numbering through all files
+        info_part = pd.DataFrame(part["info"])
+        locs_part = pd.DataFrame(part["locs"], columns=list(part["locs"]), dtype=object)
+        info_part['record'] += count
+        locs_part['record'] += count
+        info_parts.append(info_part)
+        locs_parts.append(locs_part)
+        count += part["count"]
+
+    # Information about source data
+    info_df = pd.concat(info_parts, ignore_index=True)
+    info_df['targetBiotype'] = info_df['targetBiotype'].replace('', 'NA')
+    info_df = info_df[['targetId', 'targetBiotype', 'numLocations']]
+    info_df.index = range(1, count + 1)
+
+    # Phase 2: all location items at once
+    locs_df = pd.concat(locs_parts, ignore_index=True)
+    dataset_df, locs_without_sl_code, not_standart = annotate_locations(locs_df)
+    count_targets = dataset_df['record'].nunique()
+    count_locs = len(dataset_df.index)
 
     # Define pandas Dataframe with the columns to get from the json
-    dataset_df = pd.DataFrame(columns=result)
+    dataset_df = apply_schema(dataset_df[result], 'target')
+    dataset_df.index = range(1, count_locs + 1)
 
-    # Information about source data
-    info_df = pd.DataFrame(columns=['targetId', 'targetBiotype', 'numLocations'])
-
-    # Iterate through all entities in all json files
-    for index, js in enumerate(json_files):
-        ijson += 1
-        cursor = 0
-        with open(os.path.join(base_path, dataset_dir, js), encoding="UTF-8") as json_file:
-            for line_number, line in enumerate(json_file):
-                count += 1
-                cursor += 1
-                print(f'json: {ijson}/{len(json_files)}, line: {cursor}, total parsed items: {count}')
-
-                line_as_file = io.StringIO(line)
-                # Use a new parser for each line
-                record = json.load(line_as_file)
-
-                # Main key
-                target_id = record['id']
-                target_biotype = record['biotype']
-                if record['biotype'] == '':
-                    target_biotype = 'NA'
-
-                # Check number of locations:
-                if 'subcellularLocations' in record.keys():
-                    num_locations = record['subcellularLocations'].__len__()
-
-                    # Explore non-zero locations
-                    if num_locations > 0:
-                        # Keep info for common description of dataset
-                        info_df.loc[count] = [target_id, target_biotype, num_locations]
-
-                        # Get all "non-standart" locations: not in Subcellular Uniprot codes
-                        #TODO: do we need this information?
-                        loc_names = [el['location'] for el in record['subcellularLocations'] if 'location' in el.keys()]
-                        for i in loc_names:
-                            if i != '':
-                                # Delete Isoform data in location field like '[Isoform p56]: Nucleus'
-                                i = i.split(":")[-1].strip()
-                                if i not in sc.code_name_dict().values():
-                                    if i not in not_standart:
-                                        not_standart.append(i)
-
-                        # SL codes for all locations from "Term_SL" field
-                        # TODO: Run on Uniprot source only
-                        terms = []
-                        for item in record['subcellularLocations']:
-                            if "source" in item.keys():
-                                if item["source"] == "uniprot":
-                                    if 'termSL' in item.keys():
-                                        terms.append(item['termSL'])
-
-                                    # Try to get location if there is no "TermSL" data
-                                    else:
-                                        locs_without_sl_code += 1
-                                        # Clean Isoform or other variant data from field "location"
-                                        iloc = item['location'].split(":")[-1].strip()
-                                        try_sl_code = sc.translate(iloc)
-                                        if try_sl_code:
-                                            print(f"! Got SL from location yet Term_SL is empty! {target_id}: {try_sl_code}")
-                                            # Add to all terms
-                                            terms.append(try_sl_code)
-                                            # TODO: delete, will get from DataFrame
-                                            locations.append(try_sl_code)
-                                        else:
-                                            if iloc not in not_standart:
-                                                not_standart.append(iloc)
-
-                        # Keep only unique locations
-                        terms = list(set(terms))
-                        #TODO: delete, will get from DataFrame
-                        locations.extend(terms)
-
-                        # Now let's put data to final DataFrame
-                        if len(terms) > 0:
-                            count_targets += 1
-                            for iterm in terms:
-                                count_locs += 1
-                                dataset_df.loc[count_locs] = [record['id'], iterm, sc.translate(iterm), sc.get_cluster(iterm)]
-
-                    else:
-                        info_df.loc[count] = [target_id, target_biotype, num_locations]
-                else:
-                    # Keep info about zero locations
-                    info_df.loc[count] = [target_id, target_biotype, 0]
-
-    # Write csv with resulting df
-    out_file = log.write_csv(dataset_df=dataset_df)
+    # Write resulting df, targets info is kept for plots
+    out_file = log.write_result(dataset_df=dataset_df)
+    write_frame(info_df, 'target_info')
 
     # Summary
     info = f'\n' \
@@ -164,58 +201,14 @@ def parse_targets():
 
     log.get_log(info=info)
 
-    # Keep several data counters for illustartions
-    # TODO: Illustrate in place? Replace Counter for another DataFrame?
-
-    locations_counter = dict(Counter(sc.translate(loc) for loc in locations))
-    # locations_df = pd.DataFrame(dict(biotype=[code2name[key] for key in locations_counter.keys()], numTargets=locations_counter.values()))
-
-    return info_df, dataset_df, locations_counter
-
-
-def get_info():
-    ########
-    # RUN
-    ########
-
-    # Get all data
-    info_df, dataset_df, locations_counter = parse_targets()
-
-
-    #################
-    # BIOTYPE
-    #################
-
-    biotype_nlocs = info_df.groupby(["targetBiotype", "numLocations"]).targetId.count().reset_index()
-
-    # Get plotter
-    plotter = Plotter(job="target")
-
-    # Plot zero-location / biotype distribution
-    zero = biotype_nlocs[biotype_nlocs.numLocations == 0]
-    fig1 = plotter.plot_hist(idf=zero, title="Targets dataset: Targets with zero locations")
-
-    # Plot nonzero-location / biotype distribution
-    non_zero = biotype_nlocs[biotype_nlocs.numLocations > 0]
-    # TODO: add single bar coloring for "protein_coding" (color_discrete_map={"protein_coding": "red"})
-    fig2 = plotter.plot_hist(idf=non_zero, title="Targets dataset: Targets with non-zero locations")
-
-    #################
-    # LOCATIONS COUNT
-    #################
-
-    # Plot locations distribution
-    locations = info_df.groupby("numLocations").targetId.count().reset_index()
-    fig3 = plotter.plot_hist(idf=locations, title="Targets dataset: Locations count distribution", nbins=max(list(info_df.numLocations))+1)
+    return info_df, dataset_df, count_locations(dataset_df)
 
-    locations_df = pd.DataFrame(dict(categories=locations_counter.keys(), count=locations_counter.values()))
-    fig4 = plotter.plot_hist(idf=locations_df, title="Targets dataset: Locations distribution hist")
-    fig5 = plotter.plot_pie_chart(idf=locations_df,
-                                  title="Targets dataset: Locations distribution",
-                                  color_map="cluster")
 
-    return fig1, fig2, fig3, fig4, fig5
+def count_locations(dataset_df):
+    """Keep several data counters for illustartions: group counts of location names"""
+    return dataset_df['targetLocationName'].value_counts(sort=False).loc[lambda counts: counts > 0].to_dict()
 
 
 if __name__ == "__main__":
-    get_info()
+    args = cli_args(description="Discovery on TARGET dataset")
+    parse_targets(workers=args.workers)
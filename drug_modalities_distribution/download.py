@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import threading
+from flask import Blueprint, Response, abort, request, stream_with_context
+import config as config
+from storage import iter_frame, result_file
+from schema import frames
+from interning import decode
+
+
+# Results served as csv
+download_results = ('drug', 'moa', 'target', 'merged')
+
+# Query parameter: filtered column
+download_filters = {'drugType': 'drugType', 'cluster': 'targetLocationCluster'}
+
+# Downloads streamed at once by server process, others are refused:
+# slow clients can not take all threads needed for dashboard callbacks
+download_slots = threading.BoundedSemaphore(config.download_threads)
+
+download = Blueprint('download', __name__)
+
+
+def csv_chunks(name, columns, filters):
+    """
+    Result rows as csv text, chunk by chunk from result file: memory does not depend on result size
+    :param columns: columns to write
+    :param filters: dict {column: values}, rows with other values are skipped
+    """
+    read_columns = columns + [column for column in filters if column not in columns]
+    # Id tables of interned results are loaded once for all chunks
+    tables = {}
+    header = True
+    for chunk in iter_frame(name, columns=read_columns):
+        for column, values in filters.items():
+            chunk = chunk[chunk[column].isin(values)]
+        yield decode(chunk[columns], tables).to_csv(index=False, header=header)
+        header = False
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@download.route('/download/<name>')
+def download_result(name):
+    """
+    Stream result as csv
+    Query: columns=drugId,drugType - columns to write, all if not set
+           drugType=Antibody&cluster=Surface - keep rows with these values, parameter may be repeated
+           gzip=1 - compress
+    """
+    if name not in download_results:
+        abort(404, f'Unknown result "{name}", choose from {list(download_results)}')
+    if not os.path.exists(result_file(name)):
+        abort(404, f'No "{name}" result yet, run discovery first')
+
+    known = list(frames[name])
+    columns = [column for column in request.args.get('columns', '').split(',') if column] or known
+    unknown = [column for column in columns if column not in known]
+    if unknown:
+        abort(400, f'Unknown columns {unknown} of "{name}", choose from {known}')
+
+    filters = {}
+    for parameter, column in download_filters.items():
+        values = request.args.getlist(parameter)
+        if not values:
+            continue
+        if column not in known:
+            abort(400, f'"{name}" has no {column} to filter by {parameter}')
+        filters[column] = values
+
+    if not download_slots.acquire(blocking=False):
+        abort(503, 'Too many downloads, try again later')
+
+    chunks = csv_chunks(name, columns, filters)
+    filename, mimetype = f'{name}.csv', 'text/csv'
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks, filename, mimetype = gzip_chunks(chunks), f'{name}.csv.gz', 'application/gzip'
+    response = Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    # Slot is free when response is closed: sent, failed or client went away
+    response.call_on_close(download_slots.release)
+    return response
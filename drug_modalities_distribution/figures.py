@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+import traceback
+from functools import lru_cache
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # No file locks on Windows, only single process server there
+    fcntl = None
+import config as config
+from common import list_part_files
+from storage import result_file
+from pipeline import run_pipeline, discovery_stages
+# Modules are imported right away (no computation on import): importing pandas in build thread
+# while request thread serializes figures leaves pandas partially initialized for the latter
+import discover2plot
+from merged2plot import DMD
+from shared import ColumnStore, publish_merged
+
+
+# Dataset inputs of each page
+page_inputs = {
+    'drug': [os.path.join(config.datasets_dir, 'molecule')],
+    'moa': [os.path.join(config.datasets_dir, 'mechanismOfAction')],
+    'target': [os.path.join(config.datasets_dir, 'targets'), config.sc_file],
+}
+page_inputs['dmd'] = page_inputs['drug'] + page_inputs['moa'] + page_inputs['target']
+
+# Results of discovery, page figures are built from them if they are newer than dataset
+page_results = {'drug': ['drug'], 'moa': ['moa', 'moa_info'], 'target': ['target', 'target_info']}
+
+figures_dir = os.path.join(config.results_dir, 'figures')
+
+
+def input_files(page):
+    files = []
+    for path in page_inputs[page]:
+        files.extend(list_part_files(path) if os.path.isdir(path) else [path])
+    return files
+
+
+def dataset_version(page):
+    """Version of page inputs: hash of their paths, sizes and modification times"""
+    sha = hashlib.sha256()
+    for path in input_files(page):
+        stat = os.stat(path)
+        sha.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return sha.hexdigest()[:16]
+
+
+def results_fresh(page):
+    """Discovery results of page exist and are newer than its dataset"""
+    results = [result_file(name) for name in page_results[page]]
+    if not all(os.path.exists(path) for path in results):
+        return False
+    inputs = input_files(page)
+    return not inputs or min(os.path.getmtime(path) for path in results) >= max(os.path.getmtime(path) for path in inputs)
+
+
+# Figures for each page
+# force: parse datasets even if results are fresh
+
+def drug_figures(force=False):
+    from_results = not force and results_fresh('drug')
+    return dict(figures=list(discover2plot.drug_info(workers=config.workers, from_results=from_results)))
+
+
+def moa_figures(force=False):
+    from_results = not force and results_fresh('moa')
+    return dict(figures=[discover2plot.moa_info(workers=config.workers, from_results=from_results)])
+
+
+def target_figures(force=False):
+    from_results = not force and results_fresh('target')
+    return dict(figures=list(discover2plot.target_info(workers=config.workers, from_results=from_results)))
+
+
+def dmd_figures(force=False):
+    # Stale discovery results are parsed again by pipeline, concurrently, merge is re-run if they changed
+    status = run_pipeline(force=['all'] if force else [], workers=config.workers, names=discovery_stages)
+    failed = [name for name, istatus in status.items() if istatus == 'failed']
+    if failed:
+        raise RuntimeError(f'Discovery failed: {", ".join(failed)}, see logs in {config.results_dir}')
+
+    # Merged data is shared with other server processes
+    dmd = DMD(publish_merged())
+    dmd.df_info()
+    figures = [dmd.common_locations(), *dmd.clusters(), *dmd.mlp(), *dmd.reduce_locations(),
+               dmd.average_cluster(), *dmd.average_cluster_vs_modality(), *dmd.average_cluster_vs_cluster(),
+               dmd.colocalization()]
+    return dict(figures=figures, info=dmd.adc_check())
+
+
+def filtered_figures(index, filters):
+    """
+    DMD figures for merged rows matching filters: figure tables are aggregated over selected rows only
+    :param index: FilterIndex, see filters.py
+    :param filters: dict {column: list of values}
+    :return: list of figures, empty if no rows match
+    """
+    rows = index.select(filters)
+    if rows is not None and not len(rows):
+        return []
+    dmd = DMD(index.store, rows=rows, save=False)
+    return [dmd.common_locations(), *dmd.clusters(), *dmd.reduce_locations()]
+
+
+@lru_cache(maxsize=1)
+def _crossfilter_payload(path):
+    dmd = DMD(ColumnStore(path), save=False)
+    payload = dmd.crossfilter_table()
+    payload['colors'] = dict(targetLocationCluster=dmd.plotter.color_map_cluster,
+                             drugType=dmd.plotter.color_map_modality)
+    return payload
+
+
+def crossfilter_payload():
+    """
+    Count table for crossfilter page with colors, computed once per process and merged version
+    :return: dict, see DMD.crossfilter_table, with "version" of merged data
+    """
+    path = publish_merged().path
+    return dict(_crossfilter_payload(path), version=os.path.basename(path))
+
+
+builders = {'drug': drug_figures, 'moa': moa_figures, 'target': target_figures, 'dmd': dmd_figures}
+
+
+def figures_file(page, version):
+    return os.path.join(figures_dir, f'{page}_{version}.json')
+
+
+@contextmanager
+def build_lock(page):
+    """Lock between server processes: figures of page are built by one of them, others wait and read its file"""
+    os.makedirs(figures_dir, exist_ok=True)
+    with open(os.path.join(figures_dir, f'{page}.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def build(page, force=False):
+    """
+    Figures of page for current dataset version
+    Figures json persisted for this version is read if exists, else figures are built and persisted
+    :param force: rebuild from datasets anyway
+    :return: dict(version=, figures=[figure dicts], info=str | None)
+    """
+    version = dataset_version(page)
+    out_file = figures_file(page, version)
+    with build_lock(page):
+        if not force and os.path.exists(out_file):
+            with open(out_file) as infile:
+                return json.load(infile)
+
+        built = builders[page](force=force)
+        result = dict(version=version,
+                      figures=[json.loads(fig.to_json()) for fig in built['figures']],
+                      info=built.get('info'))
+
+        # Written at once, figures of other versions are dropped
+        tmp_file = f'{out_file}.tmp'
+        with open(tmp_file, 'w') as outfile:
+            json.dump(result, outfile)
+        os.replace(tmp_file, out_file)
+        for old_file in glob.glob(os.path.join(figures_dir, f'{page}_*.json')):
+            if old_file != out_file:
+                os.remove(old_file)
+    return result
+
+
+class FigureCache:
+    """
+    Process-wide memoization of page figures
+    Each page is built once per process and dataset version, concurrent requests wait for the same build
+    """
+    def __init__(self, pages, ibuild=build, version=dataset_version):
+        """
+        :param pages: page names
+        :param ibuild: function (page, force) -> dict with "version" and "figures"
+        :param version: function (page) -> current dataset version
+        """
+        self.build = ibuild
+        self.version = version
+        self.results = {}
+        self.errors = {}
+        self.started = {}
+        self.locks = {page: threading.Lock() for page in pages}
+
+    def ready(self, page):
+        """Figures are built for current dataset version"""
+        result = self.results.get(page)
+        return result is not None and result['version'] == self.version(page)
+
+    def error(self, page):
+        return self.errors.get(page)
+
+    def reset_error(self, page):
+        """Forget failed build, next start() tries again"""
+        self.errors.pop(page, None)
+
+    def running(self, page):
+        return self.locks[page].locked()
+
+    def elapsed(self, page):
+        return time.time() - self.started[page] if page in self.started else 0
+
+    def get(self, page, force=False):
+        """Figures of page, build them if not built for current dataset version: blocks until ready"""
+        if not self.ready(page):
+            with self.locks[page]:
+                if not self.ready(page):
+                    self.started[page] = time.time()
+                    self.errors.pop(page, None)
+                    try:
+                        self.results[page] = self.build(page, force=force)
+                    except Exception:
+                        self.errors[page] = traceback.format_exc()
+                        raise
+        return self.results[page]
+
+    def start(self, page, force=False):
+        """Build figures of page in background thread, nothing is done if already built or running"""
+        if self.ready(page) or self.running(page):
+            return
+        threading.Thread(target=self._build, args=(page, force), daemon=True).start()
+
+    def _build(self, page, force=False):
+        try:
+            self.get(page, force=force)
+        except Exception:
+            # Error is kept for page to show
+            pass
+
+    def rebuild(self, page):
+        """Drop cached figures of page and build them again from datasets"""
+        self.clear(page)
+        self.start(page, force=True)
+
+    def clear(self, page=None):
+        """Drop cached figures of page or all pages"""
+        for ipage in ([page] if page else list(self.locks)):
+            with self.locks[ipage]:
+                self.results.pop(ipage, None)
+                self.errors.pop(ipage, None)
+
+
+figure_cache = FigureCache(builders)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from interning import IdTable, id_columns
+from shared import publish_merged
+
+
+# Merged columns filterable in dashboard
+filter_columns = ['drugType', 'targetLocationCluster', 'targetLocationName', 'targetBiotype', 'drugId', 'targetId']
+
+
+def save_array(path, values):
+    """Write .npy file at once: readers never attach half written file"""
+    tmp_file = f'{path}.tmp{os.getpid()}'
+    with open(tmp_file, 'wb') as outfile:
+        np.save(outfile, values)
+    os.replace(tmp_file, path)
+
+
+class FilterIndex:
+    """
+    Inverted index of merged rows: sorted numbers of rows for every value of filterable columns
+    Rows of value code c are rows[indptr[c]:indptr[c + 1]]
+    Posting lists are written next to shared column files once and attached as memory maps by all processes
+    Filter is resolved on row bitmaps: union of selected values in column, intersection of columns
+    """
+    def __init__(self, store):
+        """
+        :param store: ColumnStore with merged data, see shared.py
+        """
+        self.store = store
+        self.columns = [column for column in filter_columns if column in store.arrays]
+        self.postings = {column: self.posting_lists(column) for column in self.columns}
+        self.tables = {}
+        self._labels = {}
+
+    def posting_lists(self, column):
+        """(rows, indptr) of column, built and written on first use"""
+        rows_file, indptr_file = self.store.file(column, 'rows'), self.store.file(column, 'indptr')
+        if not os.path.exists(indptr_file):
+            codes = np.asarray(self.store.arrays[column])
+            categories = self.store.categories(column)
+            size = len(categories) if categories is not None else int(codes.max(initial=-1)) + 1
+            # Stable sort keeps rows ascending for every code, missing values (-1) are not indexed
+            rows = np.argsort(codes, kind='stable').astype(np.int32)
+            rows = rows[codes[rows] >= 0]
+            indptr = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(codes[rows], minlength=size), out=indptr[1:])
+            # indptr is written last: its file marks complete index
+            save_array(rows_file, rows)
+            save_array(indptr_file, indptr)
+        return np.load(rows_file, mmap_mode='r'), np.load(indptr_file, mmap_mode='r')
+
+    def table(self, column):
+        """IdTable of id column"""
+        name = id_columns[column]
+        if name not in self.tables:
+            self.tables[name] = IdTable.load(name)
+        return self.tables[name]
+
+    def labels(self, column):
+        """Observed values of column: Series {value: rows count}, sorted by value"""
+        if column not in self._labels:
+            counts = np.diff(self.postings[column][1])
+            codes = np.flatnonzero(counts)
+            if column in id_columns:
+                values = self.table(column).names(codes)
+            else:
+                values = np.asarray(self.store.categories(column), dtype=object)[codes]
+            self._labels[column] = pd.Series(counts[codes], index=pd.Index(values, name=column)).sort_index()
+        return self._labels[column]
+
+    def search(self, column, text, limit=50):
+        """Observed values of column containing text, case insensitive: first limit of them"""
+        labels = self.labels(column).index
+        if text:
+            labels = labels[labels.str.contains(text, case=False, regex=False)]
+        return list(labels[:limit])
+
+    def codes(self, column, values):
+        """Codes of known values of column"""
+        if column in id_columns:
+            codes = self.table(column).lookup(values)
+        else:
+            codes = pd.Index(self.store.categories(column)).get_indexer(values)
+        return codes[codes >= 0]
+
+    def rows(self, column, values):
+        """Bitmap of rows with any of values in column"""
+        rows, indptr = self.postings[column]
+        bitmap = np.zeros(len(self.store), dtype=bool)
+        for code in self.codes(column, values):
+            bitmap[rows[indptr[code]:indptr[code + 1]]] = True
+        return bitmap
+
+    def select(self, filters):
+        """
+        Rows matching all filters
+        :param filters: dict {column: list of values}, no filter on column if values are empty
+        :return: sorted row numbers, None if nothing is filtered
+        """
+        mask = None
+        for column, values in filters.items():
+            if not values:
+                continue
+            bitmap = self.rows(column, values)
+            mask = bitmap if mask is None else np.logical_and(mask, bitmap, out=mask)
+        return None if mask is None else np.flatnonzero(mask)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def filter_index(refresh=True):
+    """
+    FilterIndex of published merged data, one per process and merged version
+    :param refresh: check merged version first, publish it again if inputs changed
+    """
+    global _index
+    with _index_lock:
+        if _index is None or refresh:
+            store = publish_merged()
+            if _index is None or _index.store.path != store.path:
+                _index = FilterIndex(store)
+        return _index
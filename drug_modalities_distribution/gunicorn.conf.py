@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py wsgi:server
+# Not "config": gunicorn takes module names as its settings
+import config as dmd_config
+
+
+bind = f'{dmd_config.dash_host}:{dmd_config.dash_port}'
+workers = dmd_config.dash_workers
+# Building figures takes long on first visit: it runs in background thread, workers need threads for polls
+threads = 4
+worker_class = 'gthread'
+timeout = 120
+# App and shared data are loaded once in master process and inherited by workers
+preload_app = True
+
+
+def on_starting(server):
+    from wsgi import preload
+    preload()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+
+class IncidenceMatrix:
+    """
+    Sparse rows x columns count matrix in CSR form, e.g. drugs x SL codes
+    Only non-zero cells are stored: row i has columns indices[indptr[i]:indptr[i + 1]] with counts in data
+    Plain numpy, no scipy needed
+    """
+    def __init__(self, rows, columns, indptr, indices, data):
+        """
+        :param rows: row labels
+        :param columns: column labels
+        :param indptr: int64 array, row i cells are at indptr[i]:indptr[i + 1]
+        :param indices: int32 array of column index for every stored cell, sorted within row
+        :param data: int64 array of counts for every stored cell
+        """
+        self.rows = pd.Index(rows)
+        self.columns = pd.Index(columns)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.columns)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @classmethod
+    def from_coo(cls, rows, columns, row_codes, column_codes, data):
+        """Build from (row, column, count) triplets, duplicate cells are summed"""
+        n_columns = len(columns)
+        cells = np.asarray(row_codes, dtype=np.int64) * n_columns + np.asarray(column_codes, dtype=np.int64)
+        cells, inverse = np.unique(cells, return_inverse=True)
+        data = np.bincount(inverse, weights=data, minlength=len(cells)).astype(np.int64)
+        row_of_cell = cells // n_columns if n_columns else cells
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_of_cell, minlength=len(rows)), out=indptr[1:])
+        indices = (cells % n_columns if n_columns else cells).astype(np.int32)
+        return cls(rows, columns, indptr, indices, data)
+
+    @classmethod
+    def from_frame(cls, dataset_df, row, column, values=None):
+        """
+        :param dataset_df: long-format DataFrame
+        :param row: column with row labels, e.g. drugId
+        :param column: column with column labels, e.g. targetLocation
+        :param values: column with counts, 1 per DataFrame row if None
+        """
+        dataset_df = dataset_df.dropna(subset=[row, column])
+        row_codes, rows = pd.factorize(dataset_df[row], sort=True)
+        column_codes, columns = pd.factorize(dataset_df[column].astype(object), sort=True)
+        data = np.ones(len(row_codes), dtype=np.int64) if values is None else dataset_df[values].to_numpy()
+        return cls.from_coo(rows, columns, row_codes, column_codes, data)
+
+    def row_codes(self):
+        """Row index of every stored cell"""
+        return np.repeat(np.arange(len(self.rows)), np.diff(self.indptr))
+
+    def degree(self):
+        """Number of non-zero columns in every row: Series {row: degree}"""
+        return pd.Series(np.diff(self.indptr), index=self.rows)
+
+    def row_sums(self):
+        """Sum of counts in every row: Series {row: sum}"""
+        return pd.Series(np.bincount(self.row_codes(), weights=self.data, minlength=len(self.rows)).astype(np.int64),
+                         index=self.rows)
+
+    def reduce_columns(self, mapping):
+        """
+        Merge columns to groups, counts in group are summed: drugs x SL codes -> drugs x clusters
+        :param mapping: dict | Series {column label: group label}
+        :return: IncidenceMatrix rows x groups
+        """
+        groups = pd.Series(self.columns.map(mapping), index=self.columns)
+        group_codes, group_labels = pd.factorize(groups, sort=True)
+        return self.from_coo(self.rows, group_labels, self.row_codes(), group_codes[self.indices], self.data)
+
+    def binary(self):
+        """Same pattern with all counts set to 1"""
+        return IncidenceMatrix(self.rows, self.columns, self.indptr, self.indices, np.ones_like(self.data))
+
+    def gram(self):
+        """
+        Columns x columns product of transposed matrix and matrix, for binary drugs x locations:
+        number of drugs linked to both locations, diagonal: number of drugs linked to location
+        Every row adds its degree^2 column pairs, pairs are summed in one bincount
+        :return: dense DataFrame columns x columns
+        """
+        n_columns = len(self.columns)
+        degree = np.diff(self.indptr)
+        # Every stored cell is paired with all cells of its row
+        cell_row = self.row_codes()
+        repeats = degree[cell_row]
+        left = np.repeat(np.arange(self.nnz), repeats)
+        # Position of right cell inside row: 0..degree-1 for every left cell
+        starts = np.repeat(np.cumsum(repeats) - repeats, repeats)
+        right = np.repeat(self.indptr[cell_row], repeats) + np.arange(len(left)) - starts
+        products = self.data[left] * self.data[right]
+        pairs = self.indices[left].astype(np.int64) * n_columns + self.indices[right]
+        product = np.bincount(pairs, weights=products, minlength=n_columns * n_columns).astype(np.int64)
+        return pd.DataFrame(product.reshape(n_columns, n_columns), index=self.columns, columns=self.columns)
+
+    def to_frame(self):
+        """Dense DataFrame rows x columns, for matrices with few columns"""
+        dense = np.zeros(self.shape, dtype=np.int64)
+        dense[self.row_codes(), self.indices] = self.data
+        return pd.DataFrame(dense, index=self.rows, columns=self.columns)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from storage import read_frame, write_frame
+
+
+# Id column: table name
+id_columns = {'drugId': 'drug', 'targetId': 'target'}
+
+
+class IdTable:
+    """
+    Dense int32 codes for string ids: CHEMBL4594472 -> 17
+    Code is position of id in table, new ids are added at the end so known codes never change
+    """
+    def __init__(self, name, ids=()):
+        """
+        :param name: table name: drug | target
+        :param ids: initial ids
+        """
+        self.name = name
+        # Known ids: {id: code}, ids list in code order, array of ids is built on use
+        self.codes = {}
+        self.id_list = []
+        self.id_array = np.array([], dtype=object)
+        self.intern(ids)
+
+    def __len__(self):
+        return len(self.id_list)
+
+    @property
+    def ids(self):
+        if len(self.id_array) != len(self.id_list):
+            self.id_array = np.array(self.id_list, dtype=object)
+        return self.id_array
+
+    def intern(self, values):
+        """
+        Codes for ids, unknown ids get new codes
+        Only values are factorized, unseen ids are appended: cost does not grow with table size
+        :param values: list | Series | array of string ids
+        :return: int32 numpy array of codes
+        """
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        unique_codes = []
+        for value in uniques:
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.id_list)
+                self.id_list.append(value)
+            unique_codes.append(code)
+        # Missing ids (factorize code -1) stay -1
+        return np.array(unique_codes + [-1], dtype=np.int32)[codes]
+
+    def lookup(self, values):
+        """Codes for known ids, -1 for unknown ones, table is not changed"""
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        unique_codes = [self.codes.get(value, -1) for value in uniques]
+        return np.array(unique_codes + [-1], dtype=np.int32)[codes]
+
+    def names(self, codes):
+        """String ids for codes"""
+        return self.ids[np.asarray(codes)]
+
+    def frame(self):
+        return pd.DataFrame({'code': np.arange(len(self.ids), dtype=np.int32), 'id': self.ids})
+
+    def save(self):
+        """Write table to results dir next to results using its codes"""
+        return write_frame(self.frame(), f'{self.name}_ids')
+
+    @classmethod
+    def load(cls, name):
+        table = read_frame(f'{name}_ids')
+        return cls(name, ids=table.sort_values('code')['id'].to_numpy(dtype=object))
+
+
+def encode(dataset_df, tables):
+    """
+    Replace string id columns with int32 codes
+    :param dataset_df: pandas DataFrame
+    :param tables: dict {table name: IdTable}
+    :return: DataFrame with codes in id columns
+    """
+    dataset_df = dataset_df.copy()
+    for column, name in id_columns.items():
+        if column in dataset_df.columns:
+            dataset_df[column] = tables[name].intern(dataset_df[column].astype(object))
+    return dataset_df
+
+
+def decode(dataset_df, tables=None):
+    """
+    Replace int32 codes in id columns with string ids, tables are loaded from results dir if not given
+    Used at export and plotting boundary only
+    """
+    tables = tables or {}
+    dataset_df = dataset_df.copy()
+    for column, name in id_columns.items():
+        if column in dataset_df.columns and pd.api.types.is_integer_dtype(dataset_df[column]):
+            if name not in tables:
+                tables[name] = IdTable.load(name)
+            dataset_df[column] = tables[name].names(dataset_df[column])
+    return dataset_df
+
+
+def intern_ids(dataset_df, tables=None):
+    """
+    Replace string ids with codes from id tables saved in results dir, id columns with codes are kept
+    Csv results store string ids, see ResultWriter
+    """
+    tables = tables or {}
+    dataset_df = dataset_df.copy()
+    for column, name in id_columns.items():
+        if column in dataset_df.columns and not pd.api.types.is_integer_dtype(dataset_df[column]):
+            if name not in tables:
+                tables[name] = IdTable.load(name)
+            dataset_df[column] = tables[name].lookup(dataset_df[column].astype(object))
+    return dataset_df
@@ -2,32 +2,58 @@
 
 import os
 import io
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 import config as config
 from common import Log
+from storage import read_frame, write_frame, result_file, iter_frame, ResultWriter
+from schema import apply_schema, frame_dtypes, frames
+from interning import IdTable, encode, decode, intern_ids
+
+
+# Results merged to DMD data
+merge_inputs = ('drug', 'moa', 'target', 'target_info')
 
 
 def get_merged():
+       """
+       Merge drug, moa and target results, write merged and id tables to results dir
+       :return: merged DataFrame
+       """
+       # Merge within memory budget if set
+       if config.merge_memory:
+              merge_partitioned()
+              return read_merged()
+
        # Run extraction for each ds
 
-       # Prepared subsets in csv files
-       csv_path = config.results_dir
+       # Prepared subsets in results dir
 
        # drug
-       infile = os.path.join(csv_path, f'drug.csv')
-       df_drug = pd.read_csv(infile)
+       df_drug = apply_schema(read_frame('drug'), 'drug')
 
 
        # moa
-       infile = os.path.join(csv_path, f'moa.csv')
-       df_moa = pd.read_csv(infile)
+       df_moa = apply_schema(read_frame('moa'), 'moa')
 
 
        # target
-       infile = os.path.join(csv_path, f'target.csv')
-       df_target = pd.read_csv(infile)
+       df_target = apply_schema(read_frame('target'), 'target')
        # df_target = df_target.drop_duplicates()
 
+       # Target biotype from target info: filterable in dashboard
+       df_biotype = read_frame('target_info', columns=['targetId', 'targetBiotype']).drop_duplicates('targetId')
+       df_target = pd.merge(df_target, df_biotype, how='left', on='targetId')
+
+
+       # Intern ids: joins run on int32 codes, tables are saved next to merged
+       tables = {'drug': IdTable('drug', ids=df_drug.drugId), 'target': IdTable('target', ids=df_target.targetId)}
+       df_drug, df_moa, df_target = (encode(idf, tables) for idf in (df_drug, df_moa, df_target))
+       for table in tables.values():
+              table.save()
+
 
        # Get merged table
        # Merge molecule and moa
@@ -35,13 +61,13 @@ def get_merged():
 
        # Merge result with target
        merge_molecule_to_moa_to_target = pd.merge(merge_drug_to_moa, df_target, how="inner", on="targetId")
+       merge_molecule_to_moa_to_target = apply_schema(merge_molecule_to_moa_to_target, 'merged')
        buf = io.StringIO()
        merge_molecule_to_moa_to_target.info(buf=buf)
        df_info = buf.getvalue()
 
-       # Write merged to csv
-       out_file = f'{os.path.join(config.results_dir, "merged")}.csv'
-       merge_molecule_to_moa_to_target.to_csv(out_file, index=False)
+       # Write merged
+       out_file = write_frame(merge_molecule_to_moa_to_target, 'merged', export=lambda idf: decode(idf, tables))
 
        # Show and log Summary info
        # Initiate logger
@@ -57,8 +83,177 @@ def get_merged():
 
        log.get_log(info=info)
 
-       return info
+       return merge_molecule_to_moa_to_target
+
+
+class Partitions:
+       """
+       Hash partitions of DataFrame chunks on int32 key column, spilled to pickle files in work dir
+       Size in memory of every bucket and rows count of every key are counted to group buckets joined at once
+       """
+       def __init__(self, path, key, buckets):
+              self.path = path
+              self.key = key
+              self.files = [[] for _ in range(buckets)]
+              self.bytes = np.zeros(buckets, dtype=np.int64)
+              self.counts = np.zeros(0, dtype=np.int64)
+              self.rows = 0
+              self.empty = None
+              os.makedirs(path, exist_ok=True)
+
+       def write(self, chunk):
+              if self.empty is None:
+                     self.empty = chunk.iloc[:0]
+              keys = chunk[self.key].to_numpy()
+              counts = np.bincount(keys)
+              if len(counts) > len(self.counts):
+                     self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+              self.counts[:len(counts)] += counts
+              self.rows += len(keys)
+
+              bucket = bucket_of(keys, len(self.files))
+              order = np.argsort(bucket, kind='stable')
+              bounds = np.searchsorted(bucket[order], np.arange(len(self.files) + 1))
+              for ibucket in np.flatnonzero(np.diff(bounds)):
+                     part = chunk.iloc[order[bounds[ibucket]:bounds[ibucket + 1]]]
+                     part_file = os.path.join(self.path, f'{ibucket}_{len(self.files[ibucket])}.pkl')
+                     part.to_pickle(part_file)
+                     self.files[ibucket].append(part_file)
+                     self.bytes[ibucket] += part.memory_usage(deep=True).sum()
+
+       def read(self, buckets):
+              """DataFrame of all chunks in buckets"""
+              frames = [pd.read_pickle(part_file) for bucket in buckets for part_file in self.files[bucket]]
+              return pd.concat(frames, ignore_index=True) if frames else self.empty
+
+
+def bucket_of(codes, buckets):
+       """Bucket of int32 codes: multiplicative hash spreads neighbouring codes"""
+       return (codes.astype(np.int64) * 2654435761 % 2 ** 32) % buckets
+
+
+def join_sizes(left, right):
+       """
+       Memory of every bucket join: partitions of both sides and join output
+       Output rows are exact (sum of left x right rows count over keys of bucket), output row size is estimated
+       """
+       size = min(len(left.counts), len(right.counts))
+       pairs = left.counts[:size] * right.counts[:size]
+       out_rows = np.bincount(bucket_of(np.arange(size), len(left.files)), weights=pairs, minlength=len(left.files))
+       row_bytes = left.bytes.sum() / max(left.rows, 1) + right.bytes.sum() / max(right.rows, 1)
+       return left.bytes + right.bytes + out_rows * row_bytes
+
+
+def bucket_groups(sizes, budget):
+       """Consecutive buckets joined at once: sum of their sizes fits budget, at least one bucket in group"""
+       groups, group, size = [], [], 0
+       for bucket, bucket_size in enumerate(sizes):
+              if group and size + bucket_size > budget:
+                     groups.append(group)
+                     group, size = [], 0
+              group.append(bucket)
+              size += bucket_size
+       groups.append(group)
+       return groups
+
+
+def merge_partitioned(memory=None, buckets=None):
+       """
+       Out-of-core merge: same rows as get_merged, in other order
+       Inputs are read chunk by chunk and hash partitioned on join keys to buckets on disk,
+       groups of buckets fitting memory budget are joined one by one and appended to merged result:
+       drug x moa on drugId, result is partitioned again on targetId and joined with target
+       :param memory: memory budget for join of bucket group, inputs and output, MB, config.merge_memory if None
+       :param buckets: number of hash partitions, config.merge_buckets if None
+       :return: merged result file
+       """
+       budget = (memory or config.merge_memory) * 2 ** 20
+       buckets = buckets or config.merge_buckets
+       os.makedirs(config.results_dir, exist_ok=True)
+       work_dir = tempfile.mkdtemp(prefix='merge_partitions_', dir=config.results_dir)
+       tables = {'drug': IdTable('drug'), 'target': IdTable('target')}
+       # Values of categorical columns: categories of all merged chunks
+       observed = {column: set() for column in frames['merged']}
+       try:
+              # Target ids are interned first, then drug ids, then moa: codes are same as in get_merged
+              df_biotype = read_frame('target_info', columns=['targetId', 'targetBiotype']).drop_duplicates('targetId')
+              observed['targetBiotype'].update(df_biotype.targetBiotype.dropna())
+              targets = Partitions(os.path.join(work_dir, 'target'), 'targetId', buckets)
+              for chunk in iter_frame('target'):
+                     chunk = pd.merge(apply_schema(chunk, 'target'), df_biotype, how='left', on='targetId')
+                     for column in ('targetLocation', 'targetLocationName', 'targetLocationCluster'):
+                            observed[column].update(chunk[column].dropna())
+                     targets.write(encode(chunk, tables))
+
+              drugs = Partitions(os.path.join(work_dir, 'drug'), 'drugId', buckets)
+              for chunk in iter_frame('drug'):
+                     chunk = apply_schema(chunk, 'drug')
+                     for column in ('drugName', 'drugType'):
+                            observed[column].update(chunk[column].dropna())
+                     drugs.write(encode(chunk, tables))
+
+              moas = Partitions(os.path.join(work_dir, 'moa'), 'drugId', buckets)
+              for chunk in iter_frame('moa'):
+                     moas.write(encode(apply_schema(chunk, 'moa'), tables))
+              for table in tables.values():
+                     table.save()
+
+              # Merge molecule and moa bucket by bucket
+              drug_moa = Partitions(os.path.join(work_dir, 'drug_moa'), 'targetId', buckets)
+              for group in bucket_groups(join_sizes(drugs, moas), budget):
+                     drug_moa.write(pd.merge(drugs.read(group), moas.read(group), on="drugId"))
+
+              # Merge result with target, merged chunks are written right away
+              dtypes = frame_dtypes('merged', observed)
+              writer = ResultWriter('merged', export=lambda idf: decode(idf, tables), same_dtypes=True)
+              rows, groups = 0, bucket_groups(join_sizes(drug_moa, targets), budget)
+              for group in groups:
+                     chunk = pd.merge(drug_moa.read(group), targets.read(group), how="inner", on="targetId")
+                     writer.write(chunk[list(dtypes)].astype(dtypes))
+                     rows += len(chunk.index)
+              out_file = writer.close()
+       finally:
+              shutil.rmtree(work_dir, ignore_errors=True)
+
+       log = Log(job='merge')
+       info = f'\n' \
+              f'{"#" * 100}\n\n' \
+              f'MERGED datasets to DMD out of core!\n\n' \
+              f'{"#" * 100}\n\n' \
+              f'Resulting data in {out_file}\n\n' \
+              f'{rows} rows joined in {len(groups)} groups of {buckets} buckets, ' \
+              f'memory budget {budget / 2 ** 20:g} MB\n\n\n'
+       log.get_log(info=info)
+
+       return out_file
+
+
+def is_merged_fresh():
+       """Merged data and id tables exist and are newer than all merge inputs"""
+       outputs = [result_file(name) for name in ('merged', 'drug_ids', 'target_ids')]
+       inputs = [result_file(name) for name in merge_inputs]
+       if not all(os.path.exists(path) for path in outputs + inputs):
+              return False
+       return min(os.path.getmtime(path) for path in outputs) >= max(os.path.getmtime(path) for path in inputs)
+
+
+def read_merged():
+       """Merged DataFrame from results dir, ids are codes in any results format"""
+       return apply_schema(intern_ids(read_frame('merged')), 'merged')
+
+
+def load_merged(force=False):
+       """
+       Merged DataFrame: cached merged data if it is up to date, merge is re-run only if inputs are newer
+       :param force: re-run merge anyway
+       """
+       if not force and is_merged_fresh():
+              return read_merged()
+       return get_merged()
 
 
 if __name__ == "__main__":
-       get_merged()
+       if config.merge_memory:
+              merge_partitioned()
+       else:
+              get_merged()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-import os
+from functools import cached_property
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
@@ -8,23 +9,55 @@ from subcellular_parse import SubcellularUniprot
 import config as config
 from plotter import Plotter
 from common import Log
-from merge import get_merged
+from merge import load_merged
+from storage import read_file, result_file
+from schema import apply_schema
+from interning import decode, intern_ids
+from incidence import IncidenceMatrix
+from shared import ColumnStore
+
+
+# Dimensions of the count cube
+cube_dims = ['drugId', 'drugType', 'targetLocation', 'targetLocationName', 'targetLocationCluster']
+
+# Dimensions of count table filtered in browser
+crossfilter_dims = ['drugType', 'targetLocationCluster', 'targetLocationName', 'multipleLocations']
 
 
 class DMD:
-    def __init__(self):
+    def __init__(self, merged=None, rows=None, save=True):
+        """
+        :param merged: merged DataFrame | path to merged result file | ColumnStore with merged data shared
+                       by processes | None - cached merged data, merge is re-run only if its inputs are newer
+        :param rows: sorted numbers of merged rows to plot, all rows if None: see filters.py
+        :param save: write figures html files
+        """
         self.job = "dmd"
         self.work_path = config.results_dir
-        self.do_merge = get_merged()
-        self.merge_csv = os.path.join(self.work_path, "merged.csv")
-        self.df = pd.read_csv(self.merge_csv)
+        self.merge_file = merged if isinstance(merged, str) else result_file("merged")
+        # Aggregations run on shared column arrays if given
+        self.store = merged if isinstance(merged, ColumnStore) else None
+        self.rows = rows
+        if self.store is not None:
+            self.df = self.store.to_pandas()
+        elif isinstance(merged, pd.DataFrame):
+            self.df = apply_schema(merged, "merged")
+        elif isinstance(merged, str):
+            self.df = apply_schema(intern_ids(read_file(merged)), "merged")
+        else:
+            self.df = load_merged()
+        if rows is not None:
+            self.df = self.df.take(rows)
         self.log = Log(job=self.job)
 
         # Get subcellular notations
         self.sc = SubcellularUniprot()
 
         # Get plotter
-        self.plotter = Plotter(job="dmd")
+        self.plotter = Plotter(job="dmd", save=save)
+
+        # Memoized roll-ups of count cube {(dims, dropna): Series}
+        self.rollups = {}
 
     def df_info(self):
         info = f'\n' \
@@ -38,9 +71,78 @@ class DMD:
 
         return info
 
+    @cached_property
+    def base_cube(self):
+        """
+        The only aggregation over merged rows: row count for every observed combination of cube_dims
+        Rows with missing values are kept as their own groups, e.g. SL code without name in Uniprot file
+        """
+        if self.store is not None:
+            return self.store.value_counts(cube_dims, rows=self.rows)
+        return self.df.groupby(cube_dims, observed=True, dropna=False).size().reset_index(name='count')
+
+    @cached_property
+    def location_labels(self):
+        """DataFrame indexed by SL code: targetLocationName, targetLocationCluster"""
+        labels = self.base_cube[['targetLocation', 'targetLocationName', 'targetLocationCluster']].drop_duplicates('targetLocation')
+        return labels.astype(object).set_index('targetLocation')
+
+    @cached_property
+    def locations(self):
+        """Sparse drugs x SL codes incidence matrix: merged rows count of drug in location"""
+        return IncidenceMatrix.from_frame(self.base_cube, 'drugId', 'targetLocation', values='count')
+
+    @cached_property
+    def cluster_matrix(self):
+        """Sparse drugs x clusters matrix: SL codes columns reduced to their clusters"""
+        return self.locations.reduce_columns(self.location_labels.targetLocationCluster)
+
+    @cached_property
+    def locations_per_drug(self):
+        """Series {drugId: number of merged rows with location name}, rows without name are not counted"""
+        named = self.base_cube['count'].where(self.base_cube['targetLocationName'].notna(), 0)
+        return named.groupby(self.base_cube['drugId'], observed=True).sum()
+
+    @cached_property
+    def cluster_counts(self):
+        """DataFrame drugs x clusters: merged rows count of drug in cluster, 0 if absent"""
+        return self.cluster_matrix.to_frame()
+
+    @cached_property
+    def single_cluster(self):
+        """Series {drugId: single average cluster}"""
+        return self.sc.main_clusters(self.cluster_counts)
+
+    @cached_property
+    def cube(self):
+        """
+        Count cube: base cube with per drug dimensions singleClust and multipleLocations
+        Every figure table is a roll-up of it
+        """
+        cube = self.base_cube.copy()
+        cube['locationCount'] = cube.drugId.map(self.locations_per_drug)
+        cube['multipleLocations'] = np.where(cube['locationCount'] > 1, 'ML', 'SL')
+        cube['singleClust'] = cube.drugId.map(self.single_cluster)
+        return cube
+
+    def rollup(self, *dims, dropna=True):
+        """
+        Merged rows count by dims, memoized
+        :param dropna: skip rows with missing value in dims as groupby does, figures grouped by location name
+                       do not show rows without name
+        :return: Series with dims as index
+        """
+        if (dims, dropna) not in self.rollups:
+            self.rollups[(dims, dropna)] = self.cube.groupby(list(dims), observed=True, dropna=dropna)['count'].sum()
+        return self.rollups[(dims, dropna)]
+
+    def drug_count(self, *dims):
+        """Number of unique drugs by dims, drugs are one level finer roll-up"""
+        return self.rollup('drugId', *dims).reset_index().groupby(list(dims), observed=True).size()
+
     def common_locations(self):
         # Group: targetLocationName | drugType
-        locs_drugcount = self.df.groupby('targetLocationName').drugType.value_counts().sort_index().reset_index()
+        locs_drugcount = self.rollup('targetLocationName', 'drugType').reset_index()
         locs_drugcount.columns = ['targetLocationName', 'drugType', 'drugCount']
 
         # All locations | all drug modalities
@@ -51,20 +153,20 @@ class DMD:
 
     def clusters(self):
         # Group: targetLocationCluster | drugType
-        clusters_drugcount = self.df.groupby('targetLocationCluster').drugType.value_counts().sort_index().reset_index()
+        clusters_drugcount = self.rollup('targetLocationCluster', 'drugType').reset_index()
         clusters_drugcount.columns = ['targetLocationCluster', 'drugType', 'drugCount']
         fig4 = self.plotter.plot_scatter(idf=clusters_drugcount,
                                          title="Fig. 4. Clusters | drug modalities")
 
         # Clusters counted for all locations without reduction
         # Group: targetLocationCluster | drugId
-        all_clusters = self.df.groupby('targetLocationCluster', as_index=False).drugId.count()
+        all_clusters = self.rollup('targetLocationCluster').reset_index(name='drugId')
         fig3 = self.plotter.plot_pie_chart(idf=all_clusters,
                                            color_map="cluster",
                                            title="Fig. 3. Clusters counted for all locations without reduction")
 
         # Group: targetLocationCluster | targetLocationName
-        double_drugcount = self.df.groupby(['targetLocationCluster', 'targetLocationName']).drugType.value_counts().reset_index()
+        double_drugcount = self.rollup('targetLocationCluster', 'targetLocationName', 'drugType').reset_index()
 
         fig2 = self.plotter.plot_sunbirst(idf=double_drugcount, path=['targetLocationCluster', 'targetLocationName'],
                                           title='Fig. 2. Clusters | locations | all drugs')
@@ -75,9 +177,9 @@ class DMD:
 
     def mlp(self):
         # Group by locations
-        mlp_all_df = self.df.groupby('drugId', as_index=False).targetLocationName.count()
+        mlp_all_df = self.locations_per_drug.reset_index()
         mlp_all_df.columns = ['drugId', 'locationCount']
-        drug_with_max_locs = mlp_all_df.iloc[mlp_all_df['locationCount'].idxmax()]
+        drug_with_max_locs = decode(mlp_all_df.iloc[[mlp_all_df['locationCount'].idxmax()]]).iloc[0]
         print("\nMax locations:\n", drug_with_max_locs)
 
         # Group by locations count
@@ -87,15 +189,8 @@ class DMD:
         fig6 = self.plotter.plot_hist(idf=double_mlp, nbins=300,
                                       title="Fig. 6. MLP | Number of location per target | All drugs")
 
-        # Get MLP as column
-
-        # Label all for location count & MLP flag
-        # Add location count and get MLP status for all drugs
-        df_with_mlp = pd.merge(self.df, mlp_all_df, on="drugId")
-        df_with_mlp["multipleLocations"] = df_with_mlp.apply(lambda row: "ML" if row.locationCount > 1 else "SL", axis=1)
-
         # Group by MLP | targetLocationName
-        loc_mlp = df_with_mlp.groupby('targetLocationName').multipleLocations.value_counts().reset_index()
+        loc_mlp = self.rollup('targetLocationName', 'multipleLocations').reset_index()
 
         # Distribution of ML on targetLocations !!!!!!!
         fig7 = self.plotter.plot_sunbirst(idf=loc_mlp, path=['multipleLocations', 'targetLocationName'],
@@ -111,15 +206,9 @@ class DMD:
         SPOILER: IT DID :)
         Result: Reduced clusters are more balanced
         """
-        # Get clusters count
-        # Group by drugId | targetLocationCluster
-        clust_count = self.df.groupby('drugId').targetLocationCluster.value_counts().reset_index()
-
-        # Group by drugId | clusterCount
-        clust_double_count = clust_count.groupby('drugId').targetLocationCluster.count().reset_index()
-
         # Circle for Clusters | All drugs
-        clusters_all_relative = clust_count.groupby('targetLocationCluster').drugId.count().reset_index()
+        # Drugs count for each cluster
+        clusters_all_relative = self.drug_count('targetLocationCluster').reset_index(name='drugId')
         fig8 = self.plotter.plot_pie_chart(idf=clusters_all_relative,
                                            color_map="cluster",
                                            title="Fig. 8. Clusters distribution | All drugs | Locations reduced to clusters")
@@ -127,7 +216,7 @@ class DMD:
         # >>> Compare to non-reduced:
         # >>> Clusters counted for all locations without reduction
         # >>> Group: targetLocationCluster | drugId
-        all_clusters = self.df.groupby('targetLocationCluster', as_index=False).drugId.count()
+        all_clusters = self.rollup('targetLocationCluster').reset_index(name='drugId')
         fig81 = self.plotter.plot_pie_chart(idf=all_clusters, color_map="cluster",
                                             title="(Fig. 3.) Clusters counted for all locations without reduction")
 
@@ -136,25 +225,27 @@ class DMD:
     def cluster_registry(self):
         """
         :return: dict
-        common: {drugId: [(<cluster>, <cluster count>), ], }
-        example: {'CHEMBL4594472': [('Cytoplasm', 6), ('Nucleus', 4), ('Surface', 3), ('Secreted', 2)],}
+        common: {drugId code: [(<cluster>, <cluster count>), ], }, codes are interned ids, see interning.py
+        example: {17: [('Cytoplasm', 6), ('Nucleus', 4), ('Surface', 3), ('Secreted', 2)],}
         """
         # Group by drugId | targetLocationCluster
-        clust_count = self.df.groupby('drugId').targetLocationCluster.value_counts().reset_index()
-        clust_dict = clust_count.groupby('drugId')[['targetLocationCluster', 'count']].apply(lambda g: list(map(tuple, g.values.tolist()))).to_dict()
+        clust_count = self.cluster_counts.stack()
+        clust_count = clust_count[clust_count > 0].reset_index()
+        clust_count.columns = ['drugId', 'targetLocationCluster', 'count']
+        clust_count = clust_count.sort_values(['drugId', 'count'], ascending=[True, False], kind='stable')
+
+        clust_dict = {}
+        for drug_id, iclust, icount in zip(clust_count.drugId, clust_count.targetLocationCluster, clust_count['count']):
+            clust_dict.setdefault(drug_id, []).append((iclust, int(icount)))
 
         return clust_dict
 
     def average_cluster(self):
         # Add average cluster to df as column
-        # Get registry first, not to slow script
-        idict = self.cluster_registry()
-        self.df["singleClust"] = self.df.apply(lambda row: self.sc.main_cluster(iclust_dict=dict(idict[row.drugId])), axis=1)
+        self.df["singleClust"] = self.df.drugId.map(self.single_cluster)
 
         # Group by singleCluster | drugType
-        aav_clust = self.df.groupby(['drugId', 'singleClust']).drugType.value_counts().reset_index()
-        av_clust = aav_clust.drop(['count'], axis=1)
-        clust_modality = av_clust.groupby('singleClust').drugType.value_counts().reset_index()
+        clust_modality = self.drug_count('singleClust', 'drugType').reset_index(name='count')
 
         # Average cluster | drug modality
         fig9 = self.plotter.plot_sunbirst(idf=clust_modality, path=['singleClust', 'drugType'],
@@ -168,16 +259,13 @@ class DMD:
         Discover the most crowded modalities: Small molecule & Antibody & Protein
         :return: list of fig objects
         """
-        # TODO: make av_clust reusable
-        # Group by singleCluster | drugType
-        aav_clust = self.df.groupby(['drugId', 'singleClust']).drugType.value_counts().reset_index()
-        av_clust = aav_clust.drop(['count'], axis=1)
+        # Group by drugType | singleCluster
+        av_clust = self.drug_count('drugType', 'singleClust').reset_index(name='drugId')
 
         # TODO: Plot as subplots
         figs = []
         for itype in ('Small molecule', 'Antibody', 'Protein'):
-            modality_avclust = av_clust[av_clust.drugType == itype].reset_index()
-            plot_modality_avclust = modality_avclust.groupby('singleClust').drugId.count().reset_index()
+            plot_modality_avclust = av_clust[av_clust.drugType == itype][['singleClust', 'drugId']].reset_index(drop=True)
             fig10 = self.plotter.plot_pie_chart(idf=plot_modality_avclust,
                                                 color_map="cluster",
                                                 title=f'Fig. 10.{len(figs) + 1}. Average cluster | {itype}')
@@ -190,22 +278,57 @@ class DMD:
         Clusters -> drug modality || single cluster mode
         :return: list of fig objects
         """
-        # TODO: make av_clust reusable
         # Group by singleCluster | drugType
-        aav_clust = self.df.groupby(['drugId', 'singleClust']).drugType.value_counts().reset_index()
-        av_clust = aav_clust.drop(['count'], axis=1)
+        av_clust = self.drug_count('singleClust', 'drugType').reset_index(name='drugId')
 
         # TODO: Plot as subplots
         figs = []
         for iclust in self.sc.global_locs().keys():
-            cluster_avclust = av_clust[av_clust.singleClust == iclust].reset_index()
-            plot_cluster_avclust = cluster_avclust.groupby('drugType').drugId.count().reset_index()
+            plot_cluster_avclust = av_clust[av_clust.singleClust == iclust][['drugType', 'drugId']].reset_index(drop=True)
             fig11 = self.plotter.plot_pie_chart(idf=plot_cluster_avclust,
                                                 color_map="modality",
                                                 title=f'Fig. 11.{len(figs) + 1} Average cluster | {iclust}')
             figs.append(fig11)
         return figs
 
+    def colocalization(self):
+        """
+        Locations co-occurrence: number of drugs linked to both locations
+        Single sparse product of transposed binary drugs x locations matrix with itself
+        Locations are ordered by cluster, clusters are blocks on heatmap
+        :return: fig object
+        """
+        co_occurrence = self.locations.binary().gram()
+
+        labels = self.location_labels.loc[co_occurrence.index]
+        # Same name for several SL codes: add code to keep axis labels unique
+        names = labels.targetLocationName.where(~labels.targetLocationName.duplicated(keep=False),
+                                                labels.targetLocationName + ' (' + labels.index + ')')
+        order = labels.assign(name=names).sort_values(['targetLocationCluster', 'name']).index
+        co_occurrence = co_occurrence.loc[order, order]
+        co_occurrence.index = co_occurrence.columns = names[order]
+
+        fig12 = self.plotter.plot_heatmap(idf=co_occurrence,
+                                          title='Fig. 12. Co-localization | locations | all drugs')
+
+        return fig12
+
+    def crossfilter_table(self):
+        """
+        Merged rows count by crossfilter_dims for linked figures filtered in browser
+        Columnar and dictionary encoded: dimension values are codes into their categories
+        :return: dict(dims=, categories={dim: [values]}, codes={dim: [codes]}, count=[counts]), json ready
+        """
+        # Rows without location name are kept: they are counted in clusters and modalities
+        table = self.rollup(*crossfilter_dims, dropna=False).reset_index()
+        table = table[table['count'] > 0]
+        payload = dict(dims=crossfilter_dims, categories={}, codes={}, count=table['count'].tolist())
+        for dim in crossfilter_dims:
+            values = table[dim].astype(object).fillna('Unknown').astype('category')
+            payload['categories'][dim] = [str(value) for value in values.cat.categories]
+            payload['codes'][dim] = values.cat.codes.tolist()
+        return payload
+
     def adc_check(self):
         """
         Seems like there some anomaly in Antibody's locations/clusters
@@ -218,8 +341,9 @@ class DMD:
         # Take AB with single cluster Cytoplasm | Nucleus
         # It's not strict check, but a hint: ADCs usually have name like 'LIFASTUZUMAB VEDOTIN'
 
+        single_clust = self.df.drugId.map(self.single_cluster)
         for iclust in ('Nucleus', 'Cytoplasm'):
-            adc_check = self.df[(self.df.drugType == 'Antibody') & (self.df.singleClust == iclust)].reset_index()
+            adc_check = self.df[(self.df.drugType == 'Antibody') & (single_clust == iclust)].reset_index()
             names = list(set(list(adc_check.drugName)))
             adcs = [i for i in names if ' ' in i]
             info.append(f'{len(adcs)} ADC from {len(names)} for {iclust}\n')
@@ -240,4 +364,5 @@ if __name__ == "__main__":
     dmd.average_cluster()
     dmd.average_cluster_vs_modality()
     dmd.average_cluster_vs_cluster()
+    dmd.colocalization()
     dmd.adc_check()
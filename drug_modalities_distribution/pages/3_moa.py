@@ -2,8 +2,7 @@ import os
 import sys
 
 import dash
-from dash import html, dcc
-from discover_moa import get_info
+from dash_common import figure_page
 
 
 # Get the current script's directory
@@ -16,16 +15,7 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
 
-fig = get_info()
-fig_height = '900px'
-
-
+# Figures are built on first visit and cached for the process
 dash.register_page(__name__, order=3)
 
-layout = html.Div([
-    html.H3('MoA info'),
-    html.Div([
-        dcc.Graph(figure=fig, responsive=True, style={'height': fig_height}),
-    ]),
-])
-
+layout = figure_page('moa', 'MoA info')
@@ -2,8 +2,7 @@ import os
 import sys
 
 import dash
-from dash import html, dcc
-from discover_target import get_info
+from dash_common import figure_page
 
 
 # Get the current script's directory
@@ -16,16 +15,7 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
 
-fig1, fig2, fig3, fig4, fig5 = get_info()
-fig_height = '900px'
-
+# Figures are built on first visit and cached for the process
 dash.register_page(__name__, order=4)
 
-layout = html.Div([
-    html.H3('Target info'),
-    html.Div([dcc.Graph(figure=fig1, responsive=True, style={'height': fig_height}), ]),
-    html.Div([dcc.Graph(figure=fig2, responsive=True, style={'height': fig_height}), ]),
-    html.Div([dcc.Graph(figure=fig3, responsive=True, style={'height': fig_height}), ]),
-    html.Div([dcc.Graph(figure=fig4, responsive=True, style={'height': fig_height}), ]),
-    html.Div([dcc.Graph(figure=fig5, responsive=True, style={'height': fig_height}), ]),
-])
+layout = figure_page('target', 'Target info')
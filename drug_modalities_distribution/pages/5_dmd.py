@@ -0,0 +1,91 @@
+import os
+import sys
+
+import dash
+from dash import html, dcc, Input, Output, State, ALL
+from dash_common import figure_page, fig_height
+from figures import filtered_figures
+from filters import filter_index
+
+
+# Get the current script's directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the parent directory by going one level up
+parent_dir = os.path.dirname(current_dir)
+
+# Add the parent directory to sys.path
+sys.path.append(parent_dir)
+
+
+# Figures are built on first visit and cached for the process
+dash.register_page(__name__, order=5)
+
+# Filterable merged columns: dropdown placeholder
+filter_labels = {'drugType': 'Modality', 'targetLocationCluster': 'Cluster', 'targetLocationName': 'Location',
+                 'targetBiotype': 'Biotype', 'drugId': 'Drug', 'targetId': 'Target'}
+
+# Too many drugs and targets to send as options: they are searched as typed
+searched = ('drugId', 'targetId')
+
+dmd_layout = figure_page('dmd', 'DMD info')
+
+
+def filter_id(column):
+    return {'type': 'dmd-filter', 'column': column}
+
+
+@dash.callback(Output(filter_id(ALL), 'options'),
+               Input('dmd-filters', 'id'))
+def filter_options(_):
+    # Index is built on page load, not on layout validation at server start
+    index = filter_index()
+    options = []
+    for column in filter_labels:
+        if column in searched or column not in index.columns:
+            options.append([])
+            continue
+        labels = index.labels(column)
+        options.append([{'label': f'{value} ({count})', 'value': value} for value, count in labels.items()])
+    return options
+
+
+def search_options(column):
+    @dash.callback(Output(filter_id(column), 'options', allow_duplicate=True),
+                   Input(filter_id(column), 'search_value'),
+                   State(filter_id(column), 'value'),
+                   prevent_initial_call=True)
+    def search(search_value, value):
+        # Selected values stay in options
+        index = filter_index(refresh=False)
+        if column not in index.columns:
+            return []
+        found = index.search(column, search_value)
+        return (value or []) + [item for item in found if item not in (value or [])]
+
+
+for searched_column in searched:
+    search_options(searched_column)
+
+
+@dash.callback(Output('dmd-filtered', 'children'),
+               Input(filter_id(ALL), 'value'),
+               prevent_initial_call=True)
+def filter_figures(values):
+    filters = {column: value for column, value in zip(filter_labels, values) if value}
+    if not filters:
+        return []
+    figures = filtered_figures(filter_index(refresh=False), filters)
+    if not figures:
+        return [html.P('No merged rows match filters')]
+    return [html.Div([dcc.Graph(figure=fig, responsive=True, style={'height': fig_height}), ]) for fig in figures]
+
+
+def layout(**kwargs):
+    return html.Div([
+        html.H3('Filter merged data'),
+        html.Div([dcc.Dropdown(id=filter_id(column), multi=True, placeholder=label)
+                  for column, label in filter_labels.items()], id='dmd-filters'),
+        dcc.Loading(html.Div(id='dmd-filtered')),
+        dmd_layout(**kwargs),
+    ])
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import dash
+from dash import html, dcc, Input, Output, State, ClientsideFunction
+from dash_common import fig_height
+from figures import crossfilter_payload
+
+
+# Get the current script's directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Get the parent directory by going one level up
+parent_dir = os.path.dirname(current_dir)
+
+# Add the parent directory to sys.path
+sys.path.append(parent_dir)
+
+
+# Linked DMD figures filtered in browser: server sends count table once per merged version,
+# clicks are handled by clientside callbacks in assets/crossfilter.js
+dash.register_page(__name__, order=6)
+
+graphs = ('xf-pie', 'xf-sunburst', 'xf-bar')
+
+
+@dash.callback(Output('xf-payload', 'data'),
+               Input('xf-payload', 'id'),
+               State('xf-payload', 'data'))
+def payload(_, data):
+    # Count table kept by browser session is sent again only for new merged version
+    current = crossfilter_payload()
+    if data and data.get('version') == current['version']:
+        return dash.no_update
+    return current
+
+
+dash.clientside_callback(
+    ClientsideFunction(namespace='crossfilter', function_name='select'),
+    Output('xf-selection', 'data'),
+    *[Input(graph, 'clickData') for graph in graphs],
+    Input('xf-reset', 'n_clicks'),
+    State('xf-selection', 'data'),
+)
+
+dash.clientside_callback(
+    ClientsideFunction(namespace='crossfilter', function_name='figures'),
+    *[Output(graph, 'figure') for graph in graphs],
+    Output('xf-filters', 'children'),
+    Input('xf-selection', 'data'),
+    Input('xf-payload', 'data'),
+)
+
+
+def layout(**kwargs):
+    return html.Div([
+        html.H3('DMD crossfilter'),
+        html.P('Merged rows count, click on figure to filter the others'),
+        html.Button('Reset', id='xf-reset'),
+        html.Div(id='xf-filters'),
+        dcc.Store(id='xf-payload', storage_type='session'),
+        dcc.Store(id='xf-selection'),
+        html.Div([dcc.Graph(id=graph, responsive=True, style={'height': fig_height}) for graph in graphs]),
+    ])
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+import os
+import ast
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from collections import deque
+from datetime import datetime
+import config as config
+from common import Log, list_part_files
+from storage import result_file
+
+
+def is_main_block(node):
+    """Top-level if __name__ == "__main__": statement"""
+    return isinstance(node, ast.If) and isinstance(node.test, ast.Compare) and \
+        isinstance(node.test.left, ast.Name) and node.test.left.id == '__name__'
+
+
+def local_code(script):
+    """
+    Script and all src dir modules it imports, directly or through other modules (lazy imports too)
+    Main block of imported module does not run, its imports are not taken
+    config.py is not taken as a whole: only settings used by modules, change of other settings
+    (e.g. plot template or server port) does not change code version
+    :return: (sorted list of module files, sorted list of config settings used by them)
+    """
+    code, settings, pending = set(), set(), [script]
+    while pending:
+        module = pending.pop()
+        if module in code:
+            continue
+        code.add(module)
+        with open(os.path.join(config.src_dir, module), encoding='UTF-8') as infile:
+            tree = ast.parse(infile.read(), filename=module)
+        if module != script:
+            tree.body = [node for node in tree.body if not is_main_block(node)]
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'config':
+                settings.add(node.attr)
+                continue
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                imported = f'{name.split(".")[0]}.py'
+                if imported != 'config.py' and os.path.exists(os.path.join(config.src_dir, imported)):
+                    pending.append(imported)
+    return sorted(code), sorted(settings)
+
+
+class Stage:
+    """
+    Pipeline step: script with its inputs, code and outputs
+    Stage is skipped if hashes of inputs and code are the same as in manifest of previous run
+    """
+    def __init__(self, name, script, log_job, inputs, outputs, after=(), args=()):
+        """
+        :param name: stage name
+        :param script: script to run from src dir
+        :param log_job: job name used by script for its Log file
+        :param inputs: list of files or dataset dirs (all part files are taken)
+        :param outputs: list of output files or glob patterns
+        :param after: names of stages which outputs are inputs of this stage, stages without common
+                      dependencies run concurrently
+        :param args: extra command line arguments for script
+        """
+        self.name = name
+        self.script = script
+        self.log_job = log_job
+        self.inputs = inputs
+        # Change in any imported module or used setting changes code version of stage
+        self.code, self.settings = local_code(script)
+        self.outputs = outputs
+        self.after = after
+        self.args = list(args)
+        self.manifest_file = os.path.join(config.results_dir, f'{name}.manifest.json')
+
+    def input_files(self):
+        files = []
+        for path in self.inputs:
+            if os.path.isdir(path):
+                files.extend(list_part_files(path))
+            else:
+                files.append(path)
+        return files
+
+    def output_files(self):
+        files = []
+        for pattern in self.outputs:
+            files.extend(sorted(glob.glob(pattern)))
+        return files
+
+    def code_version(self):
+        sha = hashlib.sha256()
+        for module in self.code:
+            with open(os.path.join(config.src_dir, module), 'rb') as infile:
+                sha.update(infile.read())
+        for name in self.settings:
+            sha.update(f'{name}={getattr(config, name)!r}\n'.encode())
+        return sha.hexdigest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_file) as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return None
+
+    def fingerprint(self, previous=None):
+        """
+        Hashes of all inputs and code
+        Content hash is reused from previous manifest if file size and mtime are the same
+        """
+        known = previous['inputs'] if previous else {}
+        inputs = {}
+        for path in self.input_files():
+            stat = os.stat(path)
+            old = known.get(path)
+            if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime_ns:
+                sha256 = old['sha256']
+            else:
+                sha256 = file_hash(path)
+            inputs[path] = dict(size=stat.st_size, mtime=stat.st_mtime_ns, sha256=sha256)
+        return dict(inputs=inputs, code=self.code_version())
+
+    def is_fresh(self, fingerprint, previous):
+        """Same inputs and code as in previous run and all outputs exist"""
+        if previous is None:
+            return False
+        same_inputs = {path: item['sha256'] for path, item in fingerprint['inputs'].items()} == \
+                      {path: item['sha256'] for path, item in previous['inputs'].items()}
+        outputs_exist = bool(previous['outputs']) and all(os.path.exists(path) for path in previous['outputs'])
+        return same_inputs and fingerprint['code'] == previous['code'] and outputs_exist
+
+    def write_manifest(self, fingerprint):
+        manifest = dict(stage=self.name,
+                        finished=datetime.now().isoformat(timespec='seconds'),
+                        outputs=self.output_files(),
+                        **fingerprint)
+        with open(self.manifest_file, 'w') as outfile:
+            json.dump(manifest, outfile, indent=2)
+        return manifest
+
+    def command(self, workers=1):
+        cmd = [sys.executable, self.script] + self.args
+        if self.name in discovery_stages:
+            cmd += ['--workers', str(workers)]
+        return cmd
+
+    def last_log(self):
+        """Latest Log file written by stage script"""
+        logs = glob.glob(os.path.join(config.results_dir, f'{self.log_job}_*.log'))
+        return max(logs, key=os.path.getmtime) if logs else None
+
+
+class StageRun:
+    """Stage script running in separate process, its output is read in background thread"""
+    def __init__(self, stage, workers=1):
+        self.stage = stage
+        self.started = time.time()
+        self.lines = 0
+        self.last_line = ''
+        self.messages = deque()
+        self.process = subprocess.Popen(stage.command(workers=workers), cwd=config.src_dir,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, bufsize=1)
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            self.lines += 1
+            line = line.rstrip()
+            if line:
+                self.last_line = line
+                self.messages.append(line)
+
+    def poll(self):
+        returncode = self.process.poll()
+        if returncode is not None:
+            self.reader.join()
+        return returncode
+
+    def pop_messages(self):
+        messages = []
+        while self.messages:
+            messages.append(self.messages.popleft())
+        return messages
+
+
+class StatusView:
+    """Combined status of all concurrently running stages"""
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.shown = time.time()
+
+    def messages(self, runs):
+        for name, run in runs.items():
+            for line in run.pop_messages():
+                print(f'[{name}] {line}')
+
+    def status(self, runs):
+        if not runs or time.time() - self.shown < self.interval:
+            return
+        self.shown = time.time()
+        print(' | '.join(f'{name}: {time.time() - run.started:.0f}s, {run.lines:,} lines' for name, run in runs.items()))
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# Discovery stages are independent, they read only datasets
+discovery_stages = ('drug', 'moa', 'target')
+
+stages = [
+    Stage(name='drug', script='discover_drug.py', log_job='drug',
+          inputs=[os.path.join(config.datasets_dir, 'molecule')],
+          outputs=[result_file('drug')]),
+    Stage(name='moa', script='discover_moa.py', log_job='moa',
+          inputs=[os.path.join(config.datasets_dir, 'mechanismOfAction')],
+          outputs=[result_file('moa'), result_file('moa_info')]),
+    Stage(name='target', script='discover_target.py', log_job='target',
+          inputs=[os.path.join(config.datasets_dir, 'targets'), config.sc_file],
+          outputs=[result_file('target'), result_file('target_info')]),
+    # Plots are separate stages: plotting changes do not make datasets parsed again
+    Stage(name='drug_plot', script='discover2plot.py', log_job='drug_plot', args=['drug'],
+          inputs=[result_file('drug')],
+          outputs=[os.path.join(config.html_dir, 'drug_*.html')],
+          after=('drug',)),
+    Stage(name='moa_plot', script='discover2plot.py', log_job='moa_plot', args=['moa'],
+          inputs=[result_file('moa_info')],
+          outputs=[os.path.join(config.html_dir, 'moa_*.html')],
+          after=('moa',)),
+    Stage(name='target_plot', script='discover2plot.py', log_job='target_plot', args=['target'],
+          inputs=[result_file('target'), result_file('target_info')],
+          outputs=[os.path.join(config.html_dir, 'target_*.html')],
+          after=('target',)),
+    Stage(name='merge', script='merge.py', log_job='merge',
+          inputs=[result_file('drug'), result_file('moa'), result_file('target'), result_file('target_info')],
+          outputs=[result_file('merged')],
+          after=('drug', 'moa', 'target')),
+    Stage(name='merged2plot', script='merged2plot.py', log_job='dmd',
+          inputs=[result_file('merged')],
+          outputs=[os.path.join(config.html_dir, 'dmd_*.html')],
+          after=('merge',)),
+]
+
+
+def ordered(istages):
+    """Topological order of stages by their dependencies"""
+    by_name = {stage.name: stage for stage in istages}
+    done, order = set(), []
+
+    def visit(stage, path=()):
+        if stage.name in path:
+            raise ValueError(f'Cycle in pipeline: {" -> ".join(path + (stage.name,))}')
+        if stage.name not in done:
+            for name in stage.after:
+                visit(by_name[name], path + (stage.name,))
+            done.add(stage.name)
+            order.append(stage)
+
+    for istage in istages:
+        visit(istage)
+    return order
+
+
+def run_pipeline(force=(), workers=1, dry_run=False, names=None):
+    """
+    Run stages as soon as their dependencies are finished, independent stages run concurrently,
+    skip stages with unchanged inputs and code
+    :param force: names of stages to run anyway, "all" for all stages
+    :param workers: number of processes for discovery stages
+    :param dry_run: only report which stages would run
+    :param names: names of stages to run, all stages if None: dependencies out of them are not waited for
+    :return: dict {stage name: "run" | "skip" | "failed" | "blocked"}
+    """
+    os.makedirs(config.results_dir, exist_ok=True)
+    os.makedirs(config.html_dir, exist_ok=True)
+    log = Log(job='pipeline')
+    view = StatusView()
+
+    status = {}
+    pending = [stage for stage in ordered(stages) if names is None or stage.name in names]
+    selected = {stage.name for stage in pending}
+    runs = {}
+
+    while pending or runs:
+        # Start all stages with finished dependencies
+        for stage in list(pending):
+            after = [name for name in stage.after if name in selected]
+            if any(status.get(name) in (None, 'running') for name in after):
+                continue
+            pending.remove(stage)
+
+            if any(status[name] in ('failed', 'blocked') for name in after):
+                status[stage.name] = 'blocked'
+                log.get_log(info=f'{stage.name}: not started, dependency failed')
+                continue
+
+            # Inputs are checked when upstream outputs are ready
+            previous = stage.read_manifest()
+            fingerprint = stage.fingerprint(previous)
+            forced = 'all' in force or stage.name in force
+            if not forced and stage.is_fresh(fingerprint, previous):
+                status[stage.name] = 'skip'
+                log.get_log(info=f'{stage.name}: inputs and code unchanged, skipped')
+                continue
+
+            log.get_log(info=f'{stage.name}: running {stage.script}{" (forced)" if forced else ""}')
+            if dry_run:
+                status[stage.name] = 'run'
+                continue
+            status[stage.name] = 'running'
+            runs[stage.name] = StageRun(stage, workers=workers)
+
+        # Show progress and collect finished stages
+        view.messages(runs)
+        for name, run in list(runs.items()):
+            returncode = run.poll()
+            if returncode is None:
+                continue
+            view.messages({name: run})
+            del runs[name]
+            if returncode == 0:
+                status[name] = 'run'
+                # Inputs of downstream stages are outputs of this stage: take them after run
+                run.stage.write_manifest(run.stage.fingerprint(run.stage.read_manifest()))
+                log.get_log(info=f'{name}: finished in {time.time() - run.started:.0f}s')
+            else:
+                status[name] = 'failed'
+                log.get_log(info=f'{name}: failed with exit code {returncode}, last output: {run.last_line}')
+        view.status(runs)
+        if runs:
+            time.sleep(0.2)
+
+    if not dry_run and names is None:
+        combined_log(status)
+    return status
+
+
+def combined_log(status):
+    """Logs of all stages in pipeline order, one section per stage"""
+    out_file = os.path.join(config.results_dir, 'dmd.log')
+    with open(out_file, 'w') as outfile:
+        for stage in ordered(stages):
+            outfile.write(f'{"#" * 100}\n# {stage.name}: {status.get(stage.name, "not started")}\n{"#" * 100}\n')
+            last_log = stage.last_log()
+            if status.get(stage.name) in ('run', 'skip', 'failed') and last_log:
+                if status[stage.name] == 'skip':
+                    outfile.write(f'# Log of previous run: {os.path.basename(last_log)}\n')
+                with open(last_log) as infile:
+                    outfile.write(infile.read())
+            outfile.write('\n')
+    return out_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental DMD pipeline")
+    parser.add_argument('--force', action='append', default=[],
+                        choices=[stage.name for stage in stages] + ['all'],
+                        help='run stage even if its inputs and code are unchanged, can be repeated')
+    parser.add_argument('--workers', type=int, default=config.workers,
+                        help='number of processes to parse dataset part files (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true', help='only show which stages would run')
+    args = parser.parse_args()
+
+    status = run_pipeline(force=args.force, workers=args.workers, dry_run=args.dry_run)
+    if 'failed' in status.values():
+        sys.exit(1)
@@ -5,22 +5,26 @@ from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import os
 import config as config
+from schema import modalities, clusters
 
 
 class Plotter:
-    def __init__(self, job):
+    def __init__(self, job, save=True):
+        """
+        :param save: write html file of every figure, off for interactive figures
+        """
         self.dir = config.html_dir
         self.job = job
+        self.save = save
         self.font = dict(size=20)
         self.template = config.template
 
         # Set color scheme for drug modalities & target locations clusters
         # To plot same colors for different tasks & compare easily
         self.plotly_colors = px.colors.qualitative.Plotly
-        self.modalities = ('Small molecule', 'Antibody', 'Protein', 'Unknown', 'Oligonucleotide', 'Oligosccharide',
-                           'Enzyme', 'Gene', 'Cell')
+        self.modalities = modalities
         self.color_map_modality = {self.modalities[_]: self.plotly_colors[_] for _ in range(len(self.modalities))}
-        self.cluster_list = ('Surface', 'Cytoplasm', 'Nucleus', 'Secreted')
+        self.cluster_list = clusters
         self.color_map_cluster = {self.cluster_list[_]: self.plotly_colors[_] for _ in range(len(self.cluster_list))}
 
     def get_colors(self, option):
@@ -35,6 +39,10 @@ class Plotter:
     def html_file(self, title):
         return os.path.join(self.dir, f'{self.job}_{title.replace(" ", "_").replace("|", "_").replace(":", "_")}.html')
 
+    def write_html(self, fig, title):
+        if self.save:
+            fig.write_html(self.html_file(title=title))
+
     def plot_scatter(self, idf, title, log_y=True):
         columns = list(idf.columns)
         fig = px.scatter(
@@ -51,7 +59,7 @@ class Plotter:
         )
         fig.update_traces(marker_size=20)
 
-        fig.write_html(self.html_file(title=title))
+        self.write_html(fig, title)
         # fig.show()
         return fig
 
@@ -90,7 +98,7 @@ class Plotter:
         if no_labels:
             fig.update_traces(textinfo='none')
 
-        fig.write_html(self.html_file(title=title))
+        self.write_html(fig, title)
         # fig.show()
 
         return fig
@@ -113,13 +121,34 @@ class Plotter:
 
         )
 
-        fig.write_html(self.html_file(title=title))
+        self.write_html(fig, title)
+        # fig.show()
+
+        return fig
+
+    def plot_heatmap(self, idf, title):
+        """Square matrix as heatmap, index and columns are axis labels"""
+        fig = px.imshow(
+            idf,
+            title=title,
+            labels=dict(color='Drugs'),
+            color_continuous_scale='Viridis',
+            aspect='equal',
+        )
+        fig.update_layout(
+            font=self.font,
+            template=self.template
+        )
+
+        self.write_html(fig, title)
         # fig.show()
 
         return fig
 
     def plot_sunbirst(self, idf, title, path):
         columns = list(idf.columns)
+        # px groups by path columns, categoricals would add empty sectors for all unobserved categories
+        idf = idf.astype({column: object for column in path})
         fig = px.sunburst(
             idf,
             title=title,
@@ -132,7 +161,7 @@ class Plotter:
             template=self.template
         )
 
-        fig.write_html(self.html_file(title=title))
+        self.write_html(fig, title)
         # fig.show()
 
         return fig
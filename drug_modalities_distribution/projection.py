@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import config as config
+from common import list_json_files
+
+
+# Top-level key with separator: "key":
+KEY = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+# Scalar value: string, number, true, false, null
+SCALAR = re.compile(r'"(?:[^"\\]|\\.)*"|[^,}\]\s]+')
+# Separator after value
+SEP = re.compile(r'\s*([,}])')
+
+# Possessive quantifiers (python 3.11+) do not backtrack: skipping is as fast as C decoder
+_P = '+' if sys.version_info >= (3, 11) else ''
+_STRING = r'"[^"\\]*' + _P + r'(?:\\.[^"\\]*' + _P + ')*' + _P + '"'
+# Text between brackets, brackets in strings are skipped with strings
+FLAT = re.compile(r'[^\[\]{}"]*' + _P + '(?:' + _STRING + r'[^\[\]{}"]*' + _P + ')*' + _P)
+# Nested value up to NESTED_DEPTH levels: [ ... ] or { ... } with matching brackets inside
+NESTED_DEPTH = 4
+_nested = FLAT.pattern
+for _ in range(NESTED_DEPTH):
+    _nested = FLAT.pattern + r'(?:[\[{]' + _nested + r'[\]}]' + FLAT.pattern + ')*' + _P
+NESTED = re.compile(r'[\[{]' + _nested + r'[\]}]')
+
+decoder = json.JSONDecoder()
+
+# Shorter lines are decoded faster in full by C decoder
+MIN_PROJECTED_LENGTH = 2048
+
+
+def json_project(line, keys):
+    """
+    Get only declared top-level keys from json line
+    Values of declared keys are decoded, others are skipped,
+    scanning stops as soon as all declared keys are found
+    :param line: str | json object in a single line
+    :param keys: collection of top-level keys to get
+    :return: dict {key: value} for keys found in record
+    """
+    if len(line) >= MIN_PROJECTED_LENGTH:
+        try:
+            return _project(line, keys)
+        except (ValueError, AttributeError, IndexError):
+            # Unusual formatting: fall back to full decode
+            pass
+    record = json.loads(line)
+    return {key: record[key] for key in keys if key in record}
+
+
+def _project(line, keys):
+    wanted = set(keys)
+    projected = {}
+    pos = line.index('{') + 1
+
+    while wanted:
+        key_match = KEY.match(line, pos)
+        if key_match is None:
+            # Empty object
+            if SEP.match(line, pos).group(1) != '}':
+                raise ValueError(f'Unexpected json at {pos}: {line[pos:pos + 20]}')
+            break
+
+        key = key_match.group(1)
+        if '\\' in key:
+            key = json.loads(f'"{key}"')
+        pos = key_match.end()
+
+        if key in wanted:
+            projected[key], pos = decoder.raw_decode(line, pos)
+            wanted.discard(key)
+        elif line[pos] in '[{':
+            pos = skip_nested(line, pos)
+        else:
+            pos = SCALAR.match(line, pos).end()
+
+        sep = SEP.match(line, pos)
+        if sep.group(1) == '}':
+            break
+        pos = sep.end()
+
+    return projected
+
+
+def skip_nested(line, pos):
+    """
+    Skip nested value without decoding it: only brackets out of strings are matched
+    :param pos: position of opening [ or {
+    :return: position after matching ] or }
+    """
+    nested = NESTED.match(line, pos)
+    if nested is not None:
+        return nested.end()
+
+    # Deeper nesting: count brackets
+    depth = 0
+    while True:
+        char = line[pos]
+        if char in '[{':
+            depth += 1
+        elif char in ']}':
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        else:
+            raise ValueError(f'Unexpected json at {pos}: {line[pos:pos + 20]}')
+        pos = FLAT.match(line, pos + 1).end()
+
+
+def benchmark(dataset_dir, keys):
+    """Compare full json decode with projection on all part files of dataset"""
+    json_files = list_json_files(os.path.join(config.datasets_dir, dataset_dir))
+    lines = []
+    for js in json_files:
+        with open(js, encoding="UTF-8") as json_file:
+            lines.extend(json_file)
+
+    start = time.perf_counter()
+    full = [json.loads(line) for line in lines]
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    projected = [json_project(line, keys) for line in lines]
+    projected_time = time.perf_counter() - start
+
+    same = all({key: record[key] for key in keys if key in record} == iprojected
+               for record, iprojected in zip(full, projected))
+
+    info = f'{dataset_dir}: {len(lines):,} lines, ' \
+           f'full decode {full_time:.2f}s, projection {projected_time:.2f}s, ' \
+           f'speedup x{full_time / max(projected_time, 1e-9):.1f}, same result: {same}'
+    print(info)
+    return info
+
+
+if __name__ == "__main__":
+    from discover_drug import drug_keys
+    from discover_moa import moa_keys
+    from discover_target import target_keys
+
+    benchmark('molecule', drug_keys)
+    benchmark('mechanismOfAction', moa_keys)
+    benchmark('targets', target_keys)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+from database import database
+
+
+# Indexed queries over results database (config.results_db), ids are string ids as in datasets
+# Each query runs on index of its filter columns, merged data is not loaded to pandas
+
+
+def result_db():
+    result_database = database()
+    if result_database is None:
+        raise RuntimeError('No results database: set results_db in config.py and run pipeline')
+    return result_database
+
+
+def in_clause(column, values):
+    """SQL condition column IN (?, ...) with its params"""
+    values = list(values)
+    return f'"{column}" IN ({", ".join("?" * len(values))})', values
+
+
+def targets_of_drug(drug_id):
+    """
+    Targets of drug with their locations
+    :return: DataFrame targetId, targetLocationName, targetLocationCluster, targetBiotype
+    """
+    return result_db().read(
+        'SELECT DISTINCT targetId, targetLocationName, targetLocationCluster, targetBiotype '
+        'FROM merged WHERE drugId = ? ORDER BY targetId, targetLocationName', (drug_id,))
+
+
+def drugs_of_target(target_id):
+    """
+    Drugs with target
+    :return: DataFrame drugId, drugName, drugType
+    """
+    return result_db().read(
+        'SELECT DISTINCT drugId, drugName, drugType FROM merged WHERE targetId = ? ORDER BY drugId', (target_id,))
+
+
+def drugs(drug_types=None, clusters=None):
+    """
+    Drugs of modalities hitting targets in clusters, e.g. drugs(['Antibody'], ['Surface'])
+    :param drug_types: list of drugType, all if None
+    :param clusters: list of targetLocationCluster, all if None
+    :return: DataFrame drugId, drugName, drugType, targetId, targetLocationCluster
+    """
+    conditions, params = [], []
+    for column, values in (('drugType', drug_types), ('targetLocationCluster', clusters)):
+        if values:
+            condition, values = in_clause(column, values)
+            conditions.append(condition)
+            params.extend(values)
+    where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+    return result_db().read(
+        'SELECT DISTINCT drugId, drugName, drugType, targetId, targetLocationCluster '
+        f'FROM merged {where}ORDER BY drugId, targetId', params)
+
+
+def drug_count(by=('drugType', 'targetLocationCluster')):
+    """
+    Number of unique drugs by merged columns
+    :return: DataFrame with by columns and drugCount
+    """
+    columns = ', '.join(f'"{column}"' for column in by)
+    return result_db().read(
+        f'SELECT {columns}, COUNT(DISTINCT drugId) AS drugCount FROM merged GROUP BY {columns} ORDER BY {columns}')
@@ -1,12 +1,8 @@
 #!/bin/bash
 
-mkdir ../results ../html
-rm ../results/*
+mkdir -p ../results ../html
 
-python3 discover_drug.py
-python3 discover_moa.py
-python3 discover_target.py
-python3 merge.py
-python3 merged2plot.py
-
-cd ../results ; for ilog in drug*.log moa*.log target*.log merge*.log ; do cat ${ilog} >> dmd.log ; done ; cd ..
\ No newline at end of file
+# Incremental run: stages with unchanged inputs and code are skipped,
+# discovery stages run concurrently, all logs are collected to results/dmd.log
+# Pass options through, e.g. ./runner.sh --force all --workers 8
+python3 pipeline.py "$@"
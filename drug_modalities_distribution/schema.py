@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache
+import pandas as pd
+from subcellular_parse import SubcellularUniprot
+
+
+# Drug modalities & target locations clusters, in order of their colors, see Plotter
+modalities = ('Small molecule', 'Antibody', 'Protein', 'Unknown', 'Oligonucleotide', 'Oligosccharide',
+              'Enzyme', 'Gene', 'Cell')
+clusters = ('Surface', 'Cytoplasm', 'Nucleus', 'Secreted')
+
+
+# Columns of all result frames
+# category: categorical with fixed category set (name of set in category_sets), None - categories as observed
+# object: plain python strings
+# int32: interned ids, see interning.py
+frames = {
+    'drug': {'drugId': 'object',
+             'drugName': 'object',
+             'drugType': 'category:modality'},
+    'moa': {'drugId': 'object',
+            'targetId': 'object'},
+    'target': {'targetId': 'object',
+               'targetLocation': 'category:sl_code',
+               'targetLocationName': 'category:sl_name',
+               'targetLocationCluster': 'category:cluster'},
+    'merged': {'drugId': 'int32',
+               'drugName': 'category',
+               'drugType': 'category:modality',
+               'targetId': 'int32',
+               'targetLocation': 'category:sl_code',
+               'targetLocationName': 'category:sl_name',
+               'targetLocationCluster': 'category:cluster',
+               'targetBiotype': 'category'},
+}
+
+
+@lru_cache(maxsize=None)
+def category_sets():
+    """Fixed category sets: drug modalities and clusters, SL codes & names from Uniprot"""
+    sc = SubcellularUniprot()
+    return {
+        'modality': list(modalities),
+        'cluster': list(clusters) + ['Unknown'],
+        'sl_code': sorted(sc.code_name),
+        'sl_name': sorted(sc.name_code),
+    }
+
+
+def categorical(column, categories=None):
+    """
+    Categorical dtype for column: fixed categories first,
+    values out of fixed set are added at the end not to lose data
+    """
+    observed = column.dropna().unique()
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        observed = observed.astype(object)
+    if categories is None:
+        return pd.CategoricalDtype(sorted(observed))
+    known = set(categories)
+    extra = sorted(value for value in observed if value not in known)
+    return pd.CategoricalDtype(categories + extra)
+
+
+def apply_schema(dataset_df, frame):
+    """
+    Set dtypes declared for frame columns, downstream groupbys run on integer codes
+    :param dataset_df: pandas DataFrame
+    :param frame: drug | moa | target | merged
+    :return: DataFrame with declared dtypes
+    """
+    dataset_df = dataset_df.copy()
+    for column, dtype in frames[frame].items():
+        if column not in dataset_df.columns:
+            continue
+        if dtype == 'object':
+            if isinstance(dataset_df[column].dtype, pd.CategoricalDtype):
+                dataset_df[column] = dataset_df[column].astype(object)
+            continue
+        if dtype == 'int32':
+            dataset_df[column] = dataset_df[column].astype('int32')
+            continue
+        fixed = dtype.split(':')[-1] if ':' in dtype else None
+        categories = category_sets()[fixed] if fixed else None
+        dataset_df[column] = dataset_df[column].astype(categorical(dataset_df[column], categories))
+    return dataset_df
+
+
+def frame_dtypes(frame, observed):
+    """
+    Dtypes of frame columns for chunks written one by one: all chunks get same categories
+    :param observed: dict {column: all values column may have}, e.g. collected from inputs
+    :return: dict {column: dtype}
+    """
+    dtypes = {}
+    for column, dtype in frames[frame].items():
+        if dtype in ('object', 'int32'):
+            dtypes[column] = dtype
+            continue
+        fixed = dtype.split(':')[-1] if ':' in dtype else None
+        categories = category_sets()[fixed] if fixed else None
+        dtypes[column] = categorical(pd.Series(list(observed[column]), dtype=object), categories)
+    return dtypes
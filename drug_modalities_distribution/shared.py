@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import config as config
+from storage import result_file
+
+
+# Published datasets: one folder of column files per dataset version
+shared_dir = os.path.join(config.results_dir, 'shared')
+
+
+def encode_strings(values):
+    """Strings as single utf-8 bytes array with offsets: string i is data[offsets[i]:offsets[i + 1]]"""
+    encoded = [str(value).encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data, offsets):
+    raw = data.tobytes()
+    return [raw[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class ColumnStore:
+    """
+    DataFrame as fixed-width numpy column arrays in .npy files, attached read-only as memory maps
+    Categorical and string columns are stored as integer codes, their categories as utf-8 bytes with offsets,
+    integer columns as they are
+    All processes attached to the same files share their memory pages: dataset memory does not grow with workers
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'columns.json')) as infile:
+            self.meta = json.load(infile)
+        self.arrays = {column: np.load(self.file(column), mmap_mode='r') for column in self.meta['columns']}
+        self._categories = {}
+
+    def file(self, column, part='codes'):
+        return os.path.join(self.path, f'{column}.{part}.npy')
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'])
+
+    def categories(self, column):
+        """Categories of coded column, None for integer column"""
+        if column not in self.meta['categorical']:
+            return None
+        if column not in self._categories:
+            data = np.load(self.file(column, 'data'), mmap_mode='r')
+            offsets = np.load(self.file(column, 'offsets'), mmap_mode='r')
+            self._categories[column] = decode_strings(data, offsets)
+        return self._categories[column]
+
+    @classmethod
+    def write(cls, dataset_df, path):
+        """
+        Write DataFrame as column files, folder is renamed to path when complete
+        :return: ColumnStore attached to written files
+        """
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        meta = dict(rows=len(dataset_df.index), columns=list(dataset_df.columns), categorical=[])
+        for column in dataset_df.columns:
+            values = dataset_df[column]
+            if pd.api.types.is_integer_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(tmp_path, f'{column}.codes.npy'), values.to_numpy())
+                continue
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            # Smallest signed codes, -1 for missing values
+            np.save(os.path.join(tmp_path, f'{column}.codes.npy'), values.cat.codes.to_numpy())
+            data, offsets = encode_strings(values.cat.categories)
+            np.save(os.path.join(tmp_path, f'{column}.data.npy'), data)
+            np.save(os.path.join(tmp_path, f'{column}.offsets.npy'), offsets)
+            meta['categorical'].append(column)
+        with open(os.path.join(tmp_path, 'columns.json'), 'w') as outfile:
+            json.dump(meta, outfile)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Published by another process meanwhile
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return cls(path)
+
+    def series(self, column):
+        """Column as pandas Series over memory-mapped codes, no copy"""
+        codes = self.arrays[column]
+        categories = self.categories(column)
+        if categories is None:
+            return pd.Series(codes, name=column, copy=False)
+        return pd.Series(pd.Categorical.from_codes(codes, categories=categories, validate=False), name=column, copy=False)
+
+    def to_pandas(self, columns=None):
+        """DataFrame over memory-mapped columns, read-only and without copy"""
+        return pd.DataFrame({column: self.series(column) for column in (columns or self.columns)}, copy=False)
+
+    def value_counts(self, columns, rows=None):
+        """
+        Rows count for every observed combination of columns, missing value (code -1) is a group too
+        Runs on codes: combinations are packed into one int64 key
+        :param rows: sorted row numbers to count, all rows if None
+        :return: DataFrame with columns and "count", sorted by columns as groupby with dropna=False
+        """
+        codes = [np.asarray(self.arrays[column]) for column in columns]
+        # Missing value is packed as last code of column: its group comes last as in groupby
+        sizes = [int(icodes.max()) + 2 if len(icodes) else 1 for icodes in codes]
+        if np.prod([float(size) for size in sizes]) >= 2 ** 63:
+            raise ValueError(f'Too many combinations of {columns} to pack into int64')
+        if rows is not None:
+            codes = [icodes[rows] for icodes in codes]
+
+        key = np.zeros(len(codes[0]), dtype=np.int64)
+        for icodes, size in zip(codes, sizes):
+            key = key * size + np.where(icodes >= 0, icodes, size - 1)
+        keys, counts = np.unique(key, return_counts=True)
+
+        # Unpack keys to codes of each column
+        result = {}
+        for column, size in reversed(list(zip(columns, sizes))):
+            icodes = keys % size
+            keys = keys // size
+            icodes = np.where(icodes == size - 1, -1, icodes)
+            categories = self.categories(column)
+            if categories is None:
+                result[column] = icodes.astype(self.arrays[column].dtype)
+            else:
+                result[column] = pd.Categorical.from_codes(icodes, categories=categories)
+        result = pd.DataFrame({column: result[column] for column in columns})
+        result['count'] = counts
+        return result
+
+
+def file_version(paths):
+    sha = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        sha.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return sha.hexdigest()[:16]
+
+
+def publish_merged():
+    """
+    Merged dataset as column files for current merged result, written once and attached by all processes
+    Merge is re-run if its inputs are newer, column files of older versions are removed
+    :return: ColumnStore
+    """
+    from merge import is_merged_fresh, load_merged
+    dataset_df = None
+    if not is_merged_fresh():
+        dataset_df = load_merged()
+
+    version = file_version([result_file(name) for name in ('merged', 'drug_ids', 'target_ids')])
+    path = os.path.join(shared_dir, f'merged_{version}')
+    if not os.path.exists(path):
+        if dataset_df is None:
+            dataset_df = load_merged()
+        os.makedirs(shared_dir, exist_ok=True)
+        ColumnStore.write(dataset_df, path)
+        # Attached memory maps of old files stay valid after removal
+        for old_path in glob.glob(os.path.join(shared_dir, 'merged_*')):
+            if old_path != path and '.tmp' not in old_path:
+                shutil.rmtree(old_path, ignore_errors=True)
+    return ColumnStore(path)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import os
+import importlib.util
+from functools import lru_cache
+import pandas as pd
+from pandas.api.types import union_categoricals
+import config as config
+from database import database
+
+
+# Format: file extension
+formats = {'feather': 'feather', 'parquet': 'parquet', 'csv': 'csv'}
+
+# Feather is written uncompressed: memory-mapped file is read without copying to heap,
+# compressed buffers are decompressed to heap on every read
+feather_compression = 'uncompressed'
+
+# Missing values are written to csv as empty fields, values like "NA" (target biotype) are kept as strings
+csv_na = dict(keep_default_na=False, na_values=[''])
+
+
+@lru_cache(maxsize=None)
+def has_pyarrow():
+    found = importlib.util.find_spec('pyarrow') is not None
+    if not found:
+        print('pyarrow is not installed, intermediate results are stored as csv')
+    return found
+
+
+def results_format(fmt=None):
+    """
+    Get format of intermediate results
+    Binary columnar formats keep dtypes (categoricals too) and need pyarrow, fallback is csv
+    """
+    fmt = fmt or config.results_format
+    if fmt not in formats:
+        raise ValueError(f'Unknown results format "{fmt}", choose from {list(formats)}')
+    if fmt != 'csv' and not has_pyarrow():
+        fmt = 'csv'
+    return fmt
+
+
+def result_file(name, fmt=None):
+    """Path to result file: <results_dir>/<name>.<format extension>"""
+    return os.path.join(config.results_dir, f'{name}.{formats[results_format(fmt)]}')
+
+
+def write_frame(dataset_df, name, fmt=None, export=None):
+    """Write whole DataFrame to results dir, export: see ResultWriter"""
+    writer = ResultWriter(name, fmt=fmt, export=export)
+    writer.write(dataset_df)
+    return writer.close()
+
+
+def read_frame(name, columns=None, fmt=None):
+    """
+    Read result DataFrame, binary formats are memory-mapped
+    :param name: result name: drug, moa, target, merged
+    :param columns: list of columns to load, all if None
+    """
+    return read_file(result_file(name, fmt), columns=columns)
+
+
+def read_file(in_file, columns=None):
+    """Read result file of any format, format is taken from file extension"""
+    fmt = os.path.splitext(in_file)[1].lstrip('.')
+    if fmt == 'feather':
+        from pyarrow import feather
+        return feather.read_table(in_file, columns=columns, memory_map=True).to_pandas()
+    if fmt == 'parquet':
+        return pd.read_parquet(in_file, columns=columns, memory_map=True)
+    return pd.read_csv(in_file, usecols=columns, **csv_na)
+
+
+def iter_frame(name, columns=None, chunk_rows=None, fmt=None):
+    """Read result DataFrame chunk by chunk, see iter_file"""
+    return iter_file(result_file(name, fmt), columns=columns, chunk_rows=chunk_rows)
+
+
+def iter_file(in_file, columns=None, chunk_rows=None):
+    """
+    Read result file as DataFrame chunks of at most chunk_rows rows: memory does not grow with file size
+    Binary formats are read batch by batch from memory-mapped file
+    :param columns: list of columns to load, all if None
+    :param chunk_rows: config.chunk_size if None
+    """
+    chunk_rows = chunk_rows or config.chunk_size
+    fmt = os.path.splitext(in_file)[1].lstrip('.')
+    if fmt == 'feather':
+        import pyarrow as pa
+        with pa.memory_map(in_file) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for offset in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(offset, chunk_rows).to_pandas()
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(in_file, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(in_file, usecols=columns, chunksize=chunk_rows, **csv_na)
+
+
+def concat_frames(frames):
+    """Concatenate DataFrame chunks, categoricals with different categories are unioned to keep dtype"""
+    if len(frames) == 1:
+        return frames[0]
+    dataset_df = pd.concat(frames, ignore_index=True)
+    for column in dataset_df.columns:
+        if not isinstance(dataset_df[column].dtype, pd.CategoricalDtype) and \
+                all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            dataset_df[column] = union_categoricals([frame[column] for frame in frames])
+    return dataset_df
+
+
+def export_csv(name, fmt=None, export=None):
+    """
+    Copy of result in csv to open it by hand, csv result is exported as it is written
+    :param export: function to prepare DataFrame for export, e.g. map interned ids back to names
+    """
+    out_file = os.path.join(config.results_dir, f'{name}.csv')
+    if results_format(fmt) != 'csv':
+        dataset_df = read_frame(name, fmt=fmt)
+        if export is not None:
+            dataset_df = export(dataset_df)
+        dataset_df.to_csv(out_file, index=False)
+    return out_file
+
+
+def load_result(name, fmt=None, export=None):
+    """
+    Load written result to results database chunk by chunk (config.results_db)
+    :param export: function applied to every chunk, e.g. map interned ids back to names
+    :return: number of loaded rows, None if there is no results database
+    """
+    result_db = database()
+    if result_db is None:
+        return None
+    chunks = iter_frame(name, fmt=fmt)
+    if export is not None:
+        chunks = (export(chunk) for chunk in chunks)
+    return result_db.load(name, chunks)
+
+
+class ResultWriter:
+    """
+    Write result DataFrame chunk by chunk in configured format
+    csv and parquet are written right away, feather is written at once on close unless chunks have same dtypes
+    """
+    def __init__(self, name, fmt=None, export=None, same_dtypes=False):
+        """
+        :param name: result name
+        :param fmt: feather | parquet | csv, config.results_format if None
+        :param export: function applied to DataFrame for csv result or csv copy (config.results_csv) and results database
+        :param same_dtypes: all chunks have same dtypes (same categories too), feather is written right away
+        """
+        self.name = name
+        self.export = export
+        self.fmt = results_format(fmt)
+        self.out_file = result_file(name, self.fmt)
+        self.same_dtypes = same_dtypes
+        self.chunks = []
+        self.parquet_writer = None
+        self.feather_writer = None
+        self.written = 0
+
+    def write(self, chunk):
+        if self.fmt == 'csv':
+            # Csv is read by hand too: interned ids are written as names, see interning.intern_ids
+            if self.export is not None:
+                chunk = self.export(chunk)
+            if self.written:
+                # Add chunk to already written file, header is there
+                chunk.to_csv(self.out_file, mode='a', header=False, index=False)
+            else:
+                chunk.to_csv(self.out_file, index=False)
+        elif self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.out_file, table.schema)
+            else:
+                table = table.cast(self.parquet_writer.schema)
+            self.parquet_writer.write_table(table)
+        elif self.same_dtypes:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(chunk.reset_index(drop=True), preserve_index=False)
+            if self.feather_writer is None:
+                # Feather is arrow ipc file, uncompressed, see feather_compression
+                self.feather_writer = pa.ipc.new_file(self.out_file, table.schema,
+                                                      options=pa.ipc.IpcWriteOptions(compression=None))
+            self.feather_writer.write_table(table)
+        else:
+            self.chunks.append(chunk)
+        self.written += 1
+
+    def close(self):
+        if self.fmt == 'parquet' and self.parquet_writer is not None:
+            self.parquet_writer.close()
+        elif self.feather_writer is not None:
+            self.feather_writer.close()
+        elif self.fmt == 'feather':
+            dataset_df = concat_frames(self.chunks)
+            dataset_df.reset_index(drop=True).to_feather(self.out_file, compression=feather_compression)
+            self.chunks = []
+
+        if config.results_csv:
+            export_csv(self.name, fmt=self.fmt, export=self.export)
+        load_result(self.name, fmt=self.fmt, export=self.export)
+        return self.out_file
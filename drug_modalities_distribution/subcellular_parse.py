@@ -1,15 +1,116 @@
 #!/usr/bin/env python3
 
 import os
-from collections import defaultdict
+import hashlib
+import pickle
+import numpy as np
+import pandas as pd
 import config as config
 
 
+# Bump to invalidate caches written by previous versions of the index
+CACHE_VERSION = 1
+
+
 class SubcellularUniprot:
-    def __init__(self, data_file=config.sc_file):
+    def __init__(self, data_file=config.sc_file, cache_file=None):
         self.data_file = data_file
         # self.data_file = config.sc_file
 
+        # Compiled index is stored next to the flat file
+        self.cache_file = cache_file or f'{os.path.splitext(data_file)[0]}.cache'
+        # Index is loaded on first lookup
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self.load_index()
+        return self._index
+
+    # Lookup maps, all lookups are dict hits
+    @property
+    def entries(self):
+        return self.index['entries']
+
+    @property
+    def code_name(self):
+        return self.index['code_name']
+
+    @property
+    def name_code(self):
+        return self.index['name_code']
+
+    @property
+    def name_cluster(self):
+        return self.index['name_cluster']
+
+    @property
+    def code_cluster(self):
+        return self.index['code_cluster']
+
+    def build_index(self):
+        """Parse flat file and compile all lookup maps"""
+        entries = self.data_from_subcellular_db()
+        code_name = self.code_name_from_db(entries)
+        # Invert clusters to {location name: cluster}
+        name_cluster = {name: cluster for cluster, names in self.global_locs().items() for name in names}
+        return dict(entries=entries,
+                    code_name=code_name,
+                    name_code={v: k for k, v in code_name.items()},
+                    name_cluster=name_cluster,
+                    code_cluster={code: name_cluster.get(name, "Unknown") for code, name in code_name.items()})
+
+    def file_hash(self):
+        sha = hashlib.sha256()
+        with open(self.data_file, 'rb') as indata:
+            for block in iter(lambda: indata.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def load_index(self):
+        """
+        Get compiled index from cache file, rebuild and store it if flat file has changed
+        Cache key: flat file size, mtime and content hash
+        """
+        stat = os.stat(self.data_file)
+        cached = None
+        try:
+            with open(self.cache_file, 'rb') as incache:
+                cached = pickle.load(incache)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+
+        if cached and cached.get('version') == CACHE_VERSION and cached.get('clusters') == self.global_locs():
+            key = cached['key']
+            if key['size'] == stat.st_size:
+                if key['mtime'] == stat.st_mtime_ns:
+                    return cached['index']
+                # File touched: check content before rebuild
+                if key['sha256'] == self.file_hash():
+                    self.write_cache(cached['index'], stat)
+                    return cached['index']
+
+        index = self.build_index()
+        self.write_cache(index, stat)
+        return index
+
+    def write_cache(self, index, stat):
+        cached = dict(version=CACHE_VERSION,
+                      key=dict(size=stat.st_size, mtime=stat.st_mtime_ns, sha256=self.file_hash()),
+                      clusters=self.global_locs(),
+                      index=index)
+        # Write to temporary file and replace, several processes can share cache
+        tmp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file, 'wb') as outcache:
+                pickle.dump(cached, outcache, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            # No cache in read-only location, index is still in memory
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
     def data_from_subcellular_db(self):
         subcellular_dict = {}
         with open(self.data_file, 'r') as indata:
@@ -31,33 +132,41 @@ class SubcellularUniprot:
                                 subcellular_dict[name][ikey] = prev + ivalue
         return subcellular_dict
 
-    def code_name_dict(self):
+    @staticmethod
+    def code_name_from_db(full):
         """
         Get short dict {code: name} from uniprot sucellular dict
         """
-        full = self.data_from_subcellular_db()
         return {full[name]['AC']: name for name in full.keys()}
 
+    def code_name_dict(self):
+        """
+        Get short dict {code: name} from uniprot sucellular dict
+        """
+        return self.code_name
+
+    def is_name(self, item):
+        """Check if item is location name in Uniprot SL"""
+        return item in self.name_code
+
     def translate(self, item):
         """
         Translate name to code or backwards
         """
-        code_name = self.code_name_dict()
-        name_code = {v: k for k, v in self.code_name_dict().items()}
-        out = None
-        if item in code_name.keys():
-            out = code_name[item]
-        elif item in code_name.values():
-            out = name_code[item]
-        else:
-            # print(f'SubcellularUnirpot: "{item}" is neither name or code in Uniprot SL!')
-            pass
+        out = self.code_name.get(item)
+        if out is None:
+            out = self.name_code.get(item)
+            # if out is None:
+            #     print(f'SubcellularUnirpot: "{item}" is neither name or code in Uniprot SL!')
         return out
 
     def translate_list(self, item_list):
         """
-        Translate name to code or backwards for the list of items
+        Translate name to code or backwards for the list or pandas Series of items
         """
+        if isinstance(item_list, pd.Series):
+            # Codes first as in translate
+            return item_list.map(self.code_name).fillna(item_list.map(self.name_code))
         translated = [self.translate(item) for item in item_list]
         return translated
 
@@ -100,35 +209,43 @@ class SubcellularUniprot:
 
     def get_cluster(self, sl_code: str) -> [str | None]:
         """Check if target is surface by Uniprot SL code"""
-        clusters = self.global_locs()
+        return self.code_cluster.get(sl_code, "Unknown")
 
-        global_loc = "Unknown"
-        for cluster in clusters:
-            if self.translate(sl_code) in clusters[cluster]:
-                global_loc = cluster
-        return global_loc
+    def get_cluster_list(self, code_list):
+        """
+        Get clusters for the list or pandas Series of Uniprot SL codes
+        """
+        if isinstance(code_list, pd.Series):
+            return code_list.map(self.code_cluster).fillna("Unknown")
+        return [self.get_cluster(code) for code in code_list]
 
-    @staticmethod
-    def main_cluster(iclust_dict):
+    # Main cluster ties are broken by this order, clusters out of it (Unknown) lose ties
+    cluster_priority = ['Surface', 'Secreted', 'Nucleus', 'Cytoplasm']
+
+    @classmethod
+    def main_clusters(cls, cluster_counts):
+        """
+        Choose single average cluster for all drugs at once: cluster with max count, ties by cluster_priority
+        :param cluster_counts: DataFrame drugs x clusters with counts, 0 for absent clusters
+        :return: Series {drug: single cluster name}
+        """
+        clusters = list(cluster_counts.columns)
+        counts = cluster_counts.to_numpy()
+        rank = np.array([len(cls.cluster_priority) - cls.cluster_priority.index(iclust)
+                         if iclust in cls.cluster_priority else 0 for iclust in clusters])
+        # Rank only for clusters with max count, argmax takes first of equal
+        is_max = counts == counts.max(axis=1, keepdims=True)
+        choice = np.where(is_max, rank, -1).argmax(axis=1)
+        return pd.Series(np.asarray(clusters, dtype=object)[choice], index=cluster_counts.index)
+
+    @classmethod
+    def main_cluster(cls, iclust_dict):
         """
         Tool for choosing single average cluster for drugs with several clusters
-        :param iclust_dict: {'CHEMBL4594472': [('Cytoplasm', 6), ('Nucleus', 4), ('Surface', 3), ('Secreted', 2)],}
+        :param iclust_dict: {'Cytoplasm': 6, 'Nucleus': 4, 'Surface': 3, 'Secreted': 2}
         :return: str | single cluster name
         """
-        priority = ['Surface', 'Secreted', 'Nucleus', 'Cytoplasm']
-        priority.reverse()
-
-        b = defaultdict(list)
-        for key, val in iclust_dict.items():
-            b[val].append(key)
-        max_clust = b[max(b)]
-
-        if len(max_clust) > 1:
-            # TODO: set better choice logic
-            single_clust = max(max_clust, key=lambda m: priority.index(m))
-        else:
-            single_clust = max_clust[0]
-        return single_clust
+        return cls.main_clusters(pd.DataFrame([iclust_dict])).iloc[0]
 
 
 # if __name__ == "__main__":
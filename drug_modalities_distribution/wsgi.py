@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import os
+import dash
+from dash import Dash, html, dcc
+from storage import result_file
+from download import download
+
+
+# Single app for discovery and DMD pages
+app = Dash(__name__, use_pages=True)
+server = app.server
+# Csv downloads of results: /download/<name>
+server.register_blueprint(download)
+
+app.layout = html.Div([
+    html.H1('Info'),
+    html.Div([
+        html.Div(
+            dcc.Link(f"{page['name']}", href=page["relative_path"])
+        ) for page in dash.page_registry.values()
+    ]),
+    dash.page_container
+])
+
+
+def preload():
+    """
+    Load data shared by server processes before they are forked:
+    Uniprot SL index and merged data column files (if discovery results exist)
+    """
+    from discover_target import sc
+    from merge import merge_inputs
+    from shared import publish_merged
+
+    sc.index
+    if all(os.path.exists(result_file(name)) for name in merge_inputs):
+        publish_merged()